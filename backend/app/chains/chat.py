@@ -2,17 +2,19 @@ from langchain.schema import StrOutputParser
 from langchain.schema.runnable import RunnablePassthrough
 from ..llm.config import get_gemini_client, get_chat_template
 
-def create_chat_chain(api_key: str = None):
+def create_chat_chain(api_key: str = None, model: str = None, max_output_tokens: int = None):
     """
     Creates a basic chat chain that can be used for simple conversations using Google's Gemini model.
     
     Args:
         api_key (str, optional): Google API key. If not provided, will look for GOOGLE_API_KEY env var.
+        model (str, optional): Gemini model name. Defaults to the fast chat model.
+        max_output_tokens (int, optional): Cap on generated tokens.
     
     Returns:
         A chain that can be used for chat interactions
     """
-    llm = get_gemini_client(api_key)
+    llm = get_gemini_client(api_key, model=model, max_output_tokens=max_output_tokens)
     prompt = get_chat_template()
     
     chain = (
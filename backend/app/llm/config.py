@@ -1,39 +1,109 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_community.vectorstores import Chroma
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_google_genai._common import GoogleGenerativeAIError
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import StrOutputParser
 from langchain.schema.runnable import RunnablePassthrough
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Chat models: the fast model answers most questions, the large one is for hard questions
+FAST_CHAT_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-1.5-flash")
+LARGE_CHAT_MODEL = os.getenv("GEMINI_LARGE_MODEL", "gemini-1.5-pro")
+
+# API keys (one per project) whose quotas are pooled: a comma separated
+# GOOGLE_API_KEYS, or just GOOGLE_API_KEY
+GOOGLE_API_KEYS: List[str] = [
+    key.strip() for key in os.getenv("GOOGLE_API_KEYS", os.getenv("GOOGLE_API_KEY", "")).split(",") if key.strip()
+]
+
+def get_default_api_key() -> str:
+    if not GOOGLE_API_KEYS:
+        raise ValueError("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
+    return GOOGLE_API_KEYS[0]
+
+# LangChain configures google.generativeai process-wide, so every client would
+# use whichever key was configured last. Clients are bound to their own key's
+# service clients instead, through private attributes of the pinned
+# langchain-google-genai/google-generativeai versions (see requirements.txt).
+@lru_cache(maxsize=None)
+def _generative_client(api_key: str) -> glm.GenerativeServiceClient:
+    return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+_generative_async_clients = {}
+
+def _generative_async_client(api_key: str) -> glm.GenerativeServiceAsyncClient:
+    # gRPC asyncio channels belong to the event loop they were created in
+    loop = asyncio.get_running_loop()
+    client = _generative_async_clients.get((api_key, loop))
+    if client is None:
+        client = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+        _generative_async_clients[(api_key, loop)] = client
+    return client
+
 # Initialize Google Gemini client
-def get_gemini_client(api_key: Optional[str] = None):
+def get_gemini_client(api_key: Optional[str] = None, model: Optional[str] = None, max_output_tokens: Optional[int] = None):
     if api_key is None:
-        api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
-    return ChatGoogleGenerativeAI(
-        #model="gemini-1.5-pro",
-        model="gemini-1.5-flash",
+        api_key = get_default_api_key()
+    llm = ChatGoogleGenerativeAI(
+        model=model or FAST_CHAT_MODEL,
         GOOGLE_API_KEY=api_key,
         temperature=0.7,
+        max_output_tokens=max_output_tokens,
         convert_system_message_to_human=True
     )
+    if not (hasattr(llm.client, "_client") and hasattr(llm.client, "_async_client")):
+        raise RuntimeError(
+            "Unsupported google-generativeai version: per-key clients can't be bound, see requirements.txt"
+        )
+    llm.client._client = _generative_client(api_key)
+    try:
+        llm.client._async_client = _generative_async_client(api_key)
+    except RuntimeError:
+        # gRPC async clients need the loop they will run in
+        logger.warning("[llm] No running event loop, async calls from this client use the process-wide API key")
+    return llm
+
+class KeyedGoogleGenerativeAIEmbeddings(GoogleGenerativeAIEmbeddings):
+    """Gemini embeddings that always call with their own API key."""
+
+    def _embed(self, texts: List[str], task_type: str, title: Optional[str] = None) -> List[List[float]]:
+        task_type = self.task_type or "retrieval_document"
+        try:
+            result = genai.embed_content(
+                model=self.model,
+                content=texts,
+                task_type=task_type,
+                title=title,
+                client=_generative_client(self.google_api_key.get_secret_value())
+            )
+        except Exception as e:
+            raise GoogleGenerativeAIError(f"Error embedding content: {e}") from e
+        return result["embedding"]
 
 # Initialize embeddings
 def get_embeddings(api_key: Optional[str] = None):
     if api_key is None:
-        api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
-    return GoogleGenerativeAIEmbeddings(
+        api_key = get_default_api_key()
+    return _keyed_embeddings(api_key)
+
+@lru_cache(maxsize=None)
+def _keyed_embeddings(api_key: str) -> KeyedGoogleGenerativeAIEmbeddings:
+    return KeyedGoogleGenerativeAIEmbeddings(
         model="models/embedding-001",
-        GOOGLE_API_KEY=api_key
+        google_api_key=api_key
     )
 
 # Basic chat template
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from app.database.database import Base
+
+class KeywordEmbedding(Base):
+    __tablename__ = "keyword_embeddings"
+
+    keyword_id = Column(Integer, ForeignKey("keywords.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # The example text the embedding was computed from, so edits are detected
+    example_text = Column(String)
+    # JSON encoded list of floats
+    embedding = Column(Text)
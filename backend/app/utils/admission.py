@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Admission control per endpoint class: requests beyond the concurrency limit
+# wait in a bounded FIFO queue, and are turned away once the queue is full or
+# they couldn't be admitted within the queue-time budget
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ASK_MAX_CONCURRENCY = int(os.getenv("ASK_MAX_CONCURRENCY", "32"))
+ASK_MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "64"))
+ASK_QUEUE_TIMEOUT_MS = float(os.getenv("ASK_QUEUE_TIMEOUT_MS", "2000"))
+# Batches stream answers for minutes, so they have their own class rather
+# than holding /ask slots (and skewing /ask's service times)
+ASK_BATCH_MAX_CONCURRENCY = int(os.getenv("ASK_BATCH_MAX_CONCURRENCY", "4"))
+ASK_BATCH_MAX_QUEUE = int(os.getenv("ASK_BATCH_MAX_QUEUE", "8"))
+ASK_BATCH_QUEUE_TIMEOUT_MS = float(os.getenv("ASK_BATCH_QUEUE_TIMEOUT_MS", "10000"))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+UPLOAD_MAX_QUEUE = int(os.getenv("UPLOAD_MAX_QUEUE", "8"))
+UPLOAD_QUEUE_TIMEOUT_MS = float(os.getenv("UPLOAD_QUEUE_TIMEOUT_MS", "10000"))
+ADMISSION_METRICS_WINDOW = 500  # Recent queue waits/service times kept per class
+
+# Endpoint class of each admission-controlled path
+ENDPOINT_CLASSES = {
+    "/ask": "ask",
+    "/ask-batch": "ask_batch",
+    "/upload-pdf": "upload",
+    "/keyword-upload": "upload"
+}
+
+# Rejection reasons
+REJECT_QUEUE_FULL = "queue_full"
+REJECT_OVER_BUDGET = "over_budget"
+REJECT_QUEUE_TIMEOUT = "queue_timeout"
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away because its endpoint class is overloaded."""
+
+    def __init__(self, endpoint_class: str, reason: str, retry_after: float):
+        super().__init__(f"Server is busy ({endpoint_class}: {reason}), retry in {retry_after:.0f}s")
+        self.endpoint_class = endpoint_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _percentile(values: Deque[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limit with a bounded FIFO wait queue for one endpoint class.
+
+    A request is rejected straight away when the queue is full, or when the
+    wait expected from its queue position (recent service times spread over
+    the concurrency limit) exceeds the queue-time budget; a queued request
+    that still isn't admitted within the budget is rejected then. Admitted requests therefore never queue for
+    longer than the budget, however large the spike.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout_ms: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout_ms / 1000
+        self._in_flight = 0
+        self._queue: Deque[asyncio.Future] = deque()
+        self._waits: Deque[float] = deque(maxlen=ADMISSION_METRICS_WINDOW)
+        self._service_times: Deque[float] = deque(maxlen=ADMISSION_METRICS_WINDOW)
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {REJECT_QUEUE_FULL: 0, REJECT_OVER_BUDGET: 0, REJECT_QUEUE_TIMEOUT: 0}
+
+    def _average_service_time(self) -> Optional[float]:
+        if not self._service_times:
+            return None
+        return sum(self._service_times) / len(self._service_times)
+
+    def _retry_after(self) -> float:
+        average = self._average_service_time() or 1.0
+        return max(1.0, average * (len(self._queue) / self.max_concurrency + 1))
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        logger.warning(f"[admission] Rejected a {self.name} request ({reason}), {self._in_flight} in flight, {len(self._queue)} queued")
+        raise AdmissionRejected(self.name, reason, self._retry_after())
+
+    async def _acquire(self):
+        if self._in_flight < self.max_concurrency and not self._queue:
+            self._in_flight += 1
+            return
+        if len(self._queue) >= self.max_queue:
+            self._reject(REJECT_QUEUE_FULL)
+        # With max_concurrency requests finishing every average service time,
+        # a slot frees up for this queue position about this much later
+        average = self._average_service_time()
+        if average is not None and (len(self._queue) + 1) * average / self.max_concurrency > self.queue_timeout:
+            self._reject(REJECT_OVER_BUDGET)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future in self._queue:
+                self._queue.remove(future)
+            elif future.done() and not future.cancelled():
+                # The slot was handed over just as this request gave up
+                self._release()
+            future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(REJECT_QUEUE_TIMEOUT)
+            raise
+
+    def _release(self):
+        """Hand the slot to the oldest waiting request, or free it."""
+        while self._queue:
+            future = self._queue.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot.
+
+        Returns:
+            When the slot was acquired (time.monotonic()), to pass to release
+
+        Raises:
+            AdmissionRejected: If the request can't be admitted within the queue-time budget
+        """
+        started = time.monotonic()
+        await self._acquire()
+        admitted_at = time.monotonic()
+        self.admitted += 1
+        self._waits.append(admitted_at - started)
+        return admitted_at
+
+    def release(self, admitted_at: float):
+        self._service_times.append(time.monotonic() - admitted_at)
+        self._release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block."""
+        admitted_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "queued": len(self._queue),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_queue_wait_ms": round(sum(self._waits) / len(self._waits) * 1000, 1) if self._waits else 0.0,
+            "p95_queue_wait_ms": round(_percentile(self._waits, 95) * 1000, 1),
+            "avg_service_ms": round((self._average_service_time() or 0.0) * 1000, 1)
+        }
+
+
+admission_limiters: Dict[str, AdmissionLimiter] = {
+    "ask": AdmissionLimiter("ask", ASK_MAX_CONCURRENCY, ASK_MAX_QUEUE, ASK_QUEUE_TIMEOUT_MS),
+    "ask_batch": AdmissionLimiter("ask_batch", ASK_BATCH_MAX_CONCURRENCY, ASK_BATCH_MAX_QUEUE, ASK_BATCH_QUEUE_TIMEOUT_MS),
+    "upload": AdmissionLimiter("upload", UPLOAD_MAX_CONCURRENCY, UPLOAD_MAX_QUEUE, UPLOAD_QUEUE_TIMEOUT_MS)
+}
+
+
+def get_admission_limiter(path: str) -> Optional[AdmissionLimiter]:
+    """The limiter for a request path, or None if the path isn't admission-controlled."""
+    if not ADMISSION_ENABLED:
+        return None
+    endpoint_class = ENDPOINT_CLASSES.get(path.rstrip("/") or path)
+    return admission_limiters.get(endpoint_class) if endpoint_class else None
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: limiter.stats() for name, limiter in admission_limiters.items()}
+
+
+class AdmissionControlMiddleware:
+    """
+    Admits /ask, batch and upload requests within their endpoint class's
+    concurrency limit and queue-time budget; requests that can't be are
+    rejected with a 503 and Retry-After instead of slowing every other
+    request down.
+
+    This is plain ASGI so the slot is held until the app has finished
+    sending the response (streamed bodies included) and is released however
+    the request ends, including a client disconnecting before the body starts.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limiter = get_admission_limiter(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            admitted_at = await limiter.acquire()
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": str(e)},
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(admitted_at)
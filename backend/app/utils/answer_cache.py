@@ -0,0 +1,199 @@
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.corpus_version import register_invalidation_callback
+
+logger = logging.getLogger(__name__)
+
+# Answer cache configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Fuzzy mode matches paraphrased questions by query embedding similarity
+ANSWER_CACHE_FUZZY = os.getenv("ANSWER_CACHE_FUZZY", "false").lower() == "true"
+ANSWER_CACHE_FUZZY_THRESHOLD = float(os.getenv("ANSWER_CACHE_FUZZY_THRESHOLD", "0.97"))
+
+
+def normalize_question(message: str) -> str:
+    """
+    Normalize a question so trivially different phrasings share a cache entry.
+    Lowercases, collapses whitespace and strips trailing punctuation.
+    """
+    normalized = re.sub(r"\s+", " ", message.strip().lower())
+    return normalized.rstrip("?!. ")
+
+
+def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+    """Unit-length float32 copy of an embedding, or None for a zero vector."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+def _fuzzy_group(key: Tuple) -> Tuple:
+    """The part of a cache key a paraphrase must share: everything but the question."""
+    return (key[0],) + key[2:]
+
+
+class AnswerCache:
+    """
+    In-memory LRU cache of /ask responses.
+
+    Entries are keyed by (user id, normalized question, chat mode, applicable
+    keyword ids, corpus version, retrieval scope), so any change to a user's
+    documents or keywords makes their previous entries unreachable. Entries
+    for a user are also dropped eagerly when their corpus version is bumped.
+
+    For fuzzy lookups, normalized query embeddings are indexed by everything
+    in the key but the question, and a lookup scores the whole group with one
+    matrix product.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        # Fuzzy group -> {key: normalized embedding}, and the group's stacked
+        # (keys, matrix), rebuilt on the next lookup after the group changes
+        self._fuzzy_index: Dict[Tuple, Dict[Tuple, np.ndarray]] = {}
+        self._fuzzy_matrices: Dict[Tuple, Tuple[List[Tuple], np.ndarray]] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(user_id: int, message: str, mode: str, keyword_ids: List[int], corpus_version: str, scope: str = "") -> Tuple:
+        return (user_id, normalize_question(message), str(mode), tuple(sorted(keyword_ids)), corpus_version, scope)
+
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry["created_at"] > self.ttl_seconds
+
+    def _remove(self, key: Tuple):
+        """Drop an entry and its fuzzy index row (caller holds the lock)."""
+        entry = self._entries.pop(key, None)
+        if entry is None or entry["embedding"] is None:
+            return
+        group = _fuzzy_group(key)
+        vectors = self._fuzzy_index.get(group)
+        if vectors is not None:
+            vectors.pop(key, None)
+            if not vectors:
+                del self._fuzzy_index[group]
+        self._fuzzy_matrices.pop(group, None)
+
+    def _group_matrix(self, group: Tuple) -> Optional[Tuple[List[Tuple], np.ndarray]]:
+        """The group's keys and stacked embeddings (caller holds the lock)."""
+        vectors = self._fuzzy_index.get(group)
+        if not vectors:
+            return None
+        stacked = self._fuzzy_matrices.get(group)
+        if stacked is None:
+            keys = list(vectors)
+            stacked = self._fuzzy_matrices[group] = (keys, np.stack([vectors[key] for key in keys]))
+        return stacked
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Return the cached response for an exact key match, if any."""
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry, now):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["response"]
+
+    def get_similar(self, key: Tuple, query_embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached response for a paraphrase of the question.
+
+        Only entries with the same user, mode, keyword ids, corpus version and
+        retrieval scope are considered, and the stored query embedding must be
+        at least ANSWER_CACHE_FUZZY_THRESHOLD cosine-similar to query_embedding.
+        """
+        if not ANSWER_CACHE_ENABLED or not ANSWER_CACHE_FUZZY or query_embedding is None:
+            return None
+        query = _normalize(query_embedding)
+        if query is None:
+            return None
+        group = _fuzzy_group(key)
+        with self._lock:
+            stacked = self._group_matrix(group)
+        if stacked is None:
+            return None
+        keys, matrix = stacked
+        # The stacked matrix is never modified in place, so it is scored outside the lock
+        scores = matrix @ query
+        now = time.monotonic()
+        with self._lock:
+            for index in np.argsort(scores)[::-1]:
+                best_score = float(scores[index])
+                if best_score < ANSWER_CACHE_FUZZY_THRESHOLD:
+                    return None
+                best_key = keys[index]
+                entry = self._entries.get(best_key)
+                if entry is None:
+                    continue
+                if self._is_expired(entry, now):
+                    self._remove(best_key)
+                    continue
+                self._entries.move_to_end(best_key)
+                self.fuzzy_hits += 1
+                logger.info(f"[answer_cache] Fuzzy hit for user_id={key[0]} similarity={best_score:.4f}")
+                return entry["response"]
+        return None
+
+    def put(self, key: Tuple, response: Dict[str, Any], query_embedding: Optional[List[float]] = None):
+        if not ANSWER_CACHE_ENABLED:
+            return
+        vector = _normalize(query_embedding) if query_embedding is not None else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                "response": response,
+                "embedding": vector,
+                "created_at": time.monotonic()
+            }
+            if vector is not None:
+                group = _fuzzy_group(key)
+                self._fuzzy_index.setdefault(group, {})[key] = vector
+                self._fuzzy_matrices.pop(group, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached answer for a user."""
+        with self._lock:
+            stale_keys = [key for key in self._entries if key[0] == user_id]
+            for key in stale_keys:
+                self._remove(key)
+        if stale_keys:
+            logger.info(f"[answer_cache] Invalidated {len(stale_keys)} cached answers for user_id={user_id}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses
+        }
+
+
+answer_cache = AnswerCache()
+
+register_invalidation_callback(lambda user_id, kind: answer_cache.invalidate_user(user_id))
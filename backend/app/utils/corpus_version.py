@@ -0,0 +1,69 @@
+import logging
+from threading import Lock
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Per-user version counters. Anything derived from a user's documents or
+# keywords (cached answers, compiled matchers, ...) is keyed on these so it
+# goes stale as soon as the underlying corpus changes.
+_document_versions: Dict[int, int] = {}
+_keyword_versions: Dict[int, int] = {}
+_version_lock = Lock()
+
+# Callbacks invoked with (user_id, kind) whenever a version is bumped
+_invalidation_callbacks: List[Callable[[int, str], None]] = []
+
+
+def register_invalidation_callback(callback: Callable[[int, str], None]):
+    """
+    Register a callback to run whenever a user's corpus changes.
+
+    Args:
+        callback: Function called with (user_id, kind) where kind is
+            "documents" or "keywords"
+    """
+    _invalidation_callbacks.append(callback)
+
+
+def _notify(user_id: int, kind: str):
+    for callback in _invalidation_callbacks:
+        try:
+            callback(user_id, kind)
+        except Exception as e:
+            logger.error(f"[corpus_version] Invalidation callback failed for user_id={user_id}: {str(e)}")
+
+
+def get_document_version(user_id: int) -> int:
+    return _document_versions.get(user_id, 0)
+
+
+def get_keyword_version(user_id: int) -> int:
+    return _keyword_versions.get(user_id, 0)
+
+
+def get_corpus_version(user_id: int) -> str:
+    """
+    Get a version string covering both the user's documents and keywords.
+    """
+    return f"{get_document_version(user_id)}.{get_keyword_version(user_id)}"
+
+
+def bump_document_version(user_id: int) -> int:
+    """Mark the user's document set as changed (upload or delete)."""
+    with _version_lock:
+        version = _document_versions.get(user_id, 0) + 1
+        _document_versions[user_id] = version
+    logger.info(f"[corpus_version] Document version for user_id={user_id} is now {version}")
+    _notify(user_id, "documents")
+    return version
+
+
+def bump_keyword_version(user_id: int) -> int:
+    """Mark the user's keyword set as changed (CRUD or keyword upload)."""
+    with _version_lock:
+        version = _keyword_versions.get(user_id, 0) + 1
+        _keyword_versions[user_id] = version
+    logger.info(f"[corpus_version] Keyword version for user_id={user_id} is now {version}")
+    _notify(user_id, "keywords")
+    return version
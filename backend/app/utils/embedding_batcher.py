@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.llm.config import get_embeddings
+from app.utils.resilience import embedding_caller
+
+logger = logging.getLogger(__name__)
+
+# Query embedding micro-batching: texts arriving within the window are sent as
+# one embedding request (0 disables batching)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "100"))  # The embedding API accepts up to 100 texts
+
+
+def batch_size_bucket(size: int) -> str:
+    """Power-of-two histogram bucket for a batch size: "1", "2", "3-4", "5-8", ..."""
+    upper = 1
+    while upper < size:
+        upper *= 2
+    lower = upper // 2 + 1
+    return str(upper) if lower >= upper else f"{lower}-{upper}"
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent single-text query embeddings into batch requests.
+
+    The first text to arrive opens a batch that is sent after the window, or
+    as soon as it reaches the maximum size; each caller then gets its own
+    vector back. At high concurrency this turns many requests against the
+    embedding quota into a few.
+
+    The installed LangChain embeddings use the same task type for queries and
+    documents, so a batch returns the same vectors as single embed_query calls.
+    """
+
+    def __init__(self, window_ms: float = EMBED_BATCH_WINDOW_MS, max_size: int = EMBED_BATCH_MAX_SIZE):
+        self.window_ms = window_ms
+        self.max_size = max_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._sending: Set[asyncio.Task] = set()
+        self._batch_sizes: Counter = Counter()
+        self.batches = 0
+        self.texts = 0
+
+    async def embed_query(self, text: str) -> List[float]:
+        if self.window_ms <= 0:
+            return (await self._embed([text]))[0]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        self.batches += 1
+        self.texts += len(texts)
+        self._batch_sizes[batch_size_bucket(len(texts))] += 1
+        return await embedding_caller.call(lambda api_key: get_embeddings(api_key).embed_documents(texts))
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            vectors = await self._embed([text for text, _ in batch])
+        except Exception as e:
+            logger.error(f"[embedding_batcher] Batch of {len(batch)} query embeddings failed: {str(e)}")
+            for _, future in batch:
+                # Callers that gave up (e.g. hit their deadline) are already done
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self._batch_sizes.items(), key=lambda item: int(item[0].split("-")[0])))
+        }
+
+
+query_embedding_batcher = QueryEmbeddingBatcher()
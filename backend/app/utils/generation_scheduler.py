@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Concurrent LLM generations across all requests, and generations allowed to
+# wait for a slot before new low-priority ones are shed
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+GENERATION_METRICS_WINDOW = 500  # Recent waits/latencies per tier kept for percentiles
+
+
+class GenerationShed(Exception):
+    """A generation was turned away because the scheduler's queue was full."""
+
+    def __init__(self, tier: str, retry_after: float):
+        super().__init__(f"Too many answers are being generated, retry in {retry_after:.0f}s")
+        self.tier = tier
+        self.retry_after = retry_after
+
+
+def _percentile(values: Deque[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class GenerationScheduler:
+    """
+    Caps concurrent LLM generations and shares the slots between subscription
+    tiers by weight.
+
+    Waiting generations are queued per tier and served by stride scheduling: a
+    tier with weight 6 gets six slots for every one of a weight 1 tier while
+    both are waiting, and no waiting tier is starved. When the queue is full,
+    the newest waiting generation of a lower-weight tier is shed to make
+    room, or the new one is if nothing queued ranks below it.
+    """
+
+    def __init__(self, weights: Dict[str, float], max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.weights = weights
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        # Tier used for users whose tier isn't configured
+        self.default_tier = min(weights, key=lambda tier: weights[tier])
+        self._in_flight = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {tier: deque() for tier in weights}
+        self._pass: Dict[str, float] = {tier: 0.0 for tier in weights}
+        self._virtual_time = 0.0
+        self._metrics: Dict[str, Dict[str, Any]] = {
+            tier: {
+                "generations": 0,
+                "shed": 0,
+                "waits": deque(maxlen=GENERATION_METRICS_WINDOW),
+                "latencies": deque(maxlen=GENERATION_METRICS_WINDOW)
+            }
+            for tier in weights
+        }
+
+    def _queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def has_free_slot(self) -> bool:
+        """Whether a generation would get a slot now, without queueing."""
+        return self._in_flight < self.max_concurrency and not self._queued()
+
+    def _retry_after(self) -> float:
+        latencies = [latency for metrics in self._metrics.values() for latency in metrics["latencies"]]
+        average = sum(latencies) / len(latencies) if latencies else 1.0
+        return max(1.0, average * (self._queued() / self.max_concurrency + 1))
+
+    def _shed(self, tier: str):
+        """Make room in a full queue, or raise GenerationShed for tier."""
+        weight = self.weights[tier]
+        lower = [queued for queued, queue in self._queues.items() if queue and self.weights[queued] < weight]
+        if not lower:
+            self._metrics[tier]["shed"] += 1
+            raise GenerationShed(tier, self._retry_after())
+        victim_tier = min(lower, key=lambda queued: self.weights[queued])
+        victim = self._queues[victim_tier].pop()
+        self._metrics[victim_tier]["shed"] += 1
+        victim.set_exception(GenerationShed(victim_tier, self._retry_after()))
+        logger.warning(f"[generation] Shed a queued {victim_tier} generation for a {tier} one")
+
+    async def _acquire(self, tier: str, wait: bool):
+        if self.has_free_slot():
+            self._in_flight += 1
+            return
+        if not wait:
+            raise GenerationShed(tier, self._retry_after())
+        if self._queued() >= self.max_queue:
+            self._shed(tier)
+        queue = self._queues[tier]
+        if not queue:
+            # A tier that was idle doesn't get credit for the time it wasn't waiting
+            self._pass[tier] = max(self._pass[tier], self._virtual_time)
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in queue:
+                queue.remove(future)
+            elif future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just as this waiter gave up
+                self._release()
+            raise
+
+    def _release(self):
+        """Hand the slot to the next waiting generation, or free it."""
+        while True:
+            waiting = [tier for tier, queue in self._queues.items() if queue]
+            if not waiting:
+                self._in_flight -= 1
+                return
+            # Ties go to the heavier tier
+            tier = min(waiting, key=lambda waiting_tier: (self._pass[waiting_tier], -self.weights[waiting_tier]))
+            future = self._queues[tier].popleft()
+            if future.done():
+                continue
+            self._virtual_time = self._pass[tier]
+            self._pass[tier] += 1 / self.weights[tier]
+            future.set_result(None)
+            return
+
+    @asynccontextmanager
+    async def slot(self, tier: Optional[str], wait: bool = True) -> AsyncIterator[None]:
+        """
+        Hold a generation slot for the duration of the block.
+
+        Args:
+            wait: Queue for a slot when none is free; with False, fail
+                straight away instead
+
+        Raises:
+            GenerationShed: If the queue is full and this tier ranks lowest,
+                or no slot is free and wait is False
+        """
+        tier = tier if tier in self.weights else self.default_tier
+        started = time.monotonic()
+        await self._acquire(tier, wait)
+        acquired = time.monotonic()
+        metrics = self._metrics[tier]
+        metrics["generations"] += 1
+        metrics["waits"].append(acquired - started)
+        try:
+            yield
+        finally:
+            metrics["latencies"].append(time.monotonic() - acquired)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": {tier: len(queue) for tier, queue in self._queues.items()},
+            "tiers": {
+                tier: {
+                    "generations": metrics["generations"],
+                    "shed": metrics["shed"],
+                    "avg_queue_wait_ms": round(sum(metrics["waits"]) / len(metrics["waits"]) * 1000, 1) if metrics["waits"] else 0.0,
+                    "p95_queue_wait_ms": round(_percentile(metrics["waits"], 95) * 1000, 1),
+                    "avg_latency_ms": round(sum(metrics["latencies"]) / len(metrics["latencies"]) * 1000, 1) if metrics["latencies"] else 0.0,
+                    "p95_latency_ms": round(_percentile(metrics["latencies"], 95) * 1000, 1)
+                }
+                for tier, metrics in self._metrics.items()
+            }
+        }
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import suppress
+from threading import Lock
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hedged LLM requests: when the first token of an answer hasn't arrived by the
+# HEDGE_PERCENTILE of recent first-token latencies, an identical second request
+# is sent and whichever produces a token first is used
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Hedges are limited to this percentage of requests, with at most
+# HEDGE_BUDGET_BURST saved up for bursts of slow responses
+HEDGE_BUDGET_PERCENT = float(os.getenv("HEDGE_BUDGET_PERCENT", "5"))
+HEDGE_BUDGET_BURST = 5
+HEDGE_LATENCY_WINDOW = 200  # Recent first-token latencies the percentile is taken over
+HEDGE_MIN_SAMPLES = 20  # No hedging until this many latencies have been seen
+
+
+class HedgePolicy:
+    """
+    Decides when to hedge one model's requests and keeps its hedge counters.
+
+    The hedge delay is a percentile of the model's recent first-token
+    latencies. The budget is a token bucket: every request adds
+    HEDGE_BUDGET_PERCENT / 100 of a token and a hedge spends one.
+    """
+
+    def __init__(
+        self,
+        percentile: float = HEDGE_PERCENTILE,
+        budget_percent: float = HEDGE_BUDGET_PERCENT,
+        window: int = HEDGE_LATENCY_WINDOW,
+        min_samples: int = HEDGE_MIN_SAMPLES
+    ):
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self.min_samples = min_samples
+        self._latencies: deque = deque(maxlen=window)
+        self._budget = 0.0
+        self._lock = Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def start_request(self) -> Optional[float]:
+        """
+        Count a request against the budget.
+
+        Returns:
+            Seconds to wait for the first token before hedging, or None while
+            there are too few latency samples
+        """
+        with self._lock:
+            self.requests += 1
+            self._budget = min(HEDGE_BUDGET_BURST, self._budget + self.budget_percent / 100)
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            return ordered[index]
+
+    def can_hedge(self) -> bool:
+        """Whether the budget has a hedge left."""
+        with self._lock:
+            return self._budget >= 1
+
+    def spend_hedge(self):
+        """Spend one hedge from the budget, once the hedge is actually running."""
+        with self._lock:
+            self._budget -= 1
+            self.hedges += 1
+
+    def record(self, first_token_seconds: float, hedge_won: bool = False):
+        with self._lock:
+            self._latencies.append(first_token_seconds)
+            if hedge_won:
+                self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._latencies)
+            delay = None
+            if len(ordered) >= self.min_samples:
+                delay = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+                "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None
+            }
+
+
+_policies: Dict[str, HedgePolicy] = {}
+_policies_lock = Lock()
+
+
+def get_hedge_policy(model: str) -> HedgePolicy:
+    """The hedge policy for a model (latency percentiles are tracked per model)."""
+    with _policies_lock:
+        if model not in _policies:
+            _policies[model] = HedgePolicy()
+        return _policies[model]
+
+
+def hedging_stats() -> Dict[str, Dict[str, Any]]:
+    with _policies_lock:
+        policies = dict(_policies)
+    return {model: policy.stats() for model, policy in policies.items()}
+
+
+async def _close(stream: AsyncIterator[Any], task: "asyncio.Future"):
+    task.cancel()
+    with suppress(BaseException):
+        await task
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        with suppress(Exception):
+            await aclose()
+
+
+async def hedged_stream(
+    start_stream: Callable[[Callable[[], None], bool], AsyncIterator[Any]],
+    policy: HedgePolicy,
+    has_capacity: Callable[[], bool] = lambda: True
+) -> AsyncIterator[Any]:
+    """
+    Stream from start_stream(), starting an identical second stream if the
+    first token is slower than the policy's hedge delay. The stream that
+    yields first is used and the other is cancelled.
+
+    Latencies and the hedge delay are measured from when the request is
+    actually sent, not from when it started waiting for capacity: a hedge
+    can't be served sooner than the request it would back up.
+
+    Args:
+        start_stream: Starts a new request and returns its async iterator.
+            Called as start_stream(on_start, hedge); the stream calls
+            on_start() when it sends the request, and a hedge (hedge=True)
+            must fail rather than wait for capacity.
+        policy: Hedge policy of the model being called
+        has_capacity: Whether a hedge could be sent right now; no hedge
+            (and no budget) is spent while it returns False
+    """
+    started = None
+    sent = asyncio.Event()
+
+    def on_primary_start():
+        nonlocal started
+        started = time.perf_counter()
+        sent.set()
+
+    def on_hedge_start():
+        policy.spend_hedge()
+        logger.info(f"[hedging] No first token after {delay * 1000:.0f}ms, sent a hedged request")
+
+    delay = policy.start_request()
+    primary = start_stream(on_primary_start, False).__aiter__()
+    # Pending first-piece task -> the stream it reads from
+    firsts = {asyncio.ensure_future(primary.__anext__()): primary}
+    winner = None
+    try:
+        if delay is not None:
+            (first,) = firsts
+            sending = asyncio.ensure_future(sent.wait())
+            try:
+                await asyncio.wait({first, sending}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sending.cancel()
+            if not first.done():
+                done, _ = await asyncio.wait({first}, timeout=max(0.0, delay - (time.perf_counter() - started)))
+                if not done and has_capacity() and policy.can_hedge():
+                    hedge = start_stream(on_hedge_start, True).__aiter__()
+                    firsts[asyncio.ensure_future(hedge.__anext__())] = hedge
+
+        # Use the first stream to produce a token; a stream that fails is only
+        # fatal when there is no other one left
+        pending = set(firsts)
+        while winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Both streams can finish in the same wait, so look at all of them
+            # before treating a failure as fatal
+            failed = []
+            for task in done:
+                error = task.exception()
+                if error is None or isinstance(error, StopAsyncIteration):
+                    winner = task
+                    break
+                failed.append(error)
+            if winner is None:
+                if not pending:
+                    raise failed[0]
+                for error in failed:
+                    logger.warning(f"[hedging] One of the hedged requests failed: {str(error)}")
+
+        stream = firsts.pop(winner)
+        if started is not None:
+            policy.record(time.perf_counter() - started, hedge_won=stream is not primary)
+        for task, other in firsts.items():
+            await _close(other, task)
+        firsts.clear()
+
+        if isinstance(winner.exception(), StopAsyncIteration):
+            return
+        yield winner.result()
+        async for piece in stream:
+            yield piece
+    finally:
+        # Cancelled (e.g. by the request deadline) before a winner was picked
+        for task, other in firsts.items():
+            await _close(other, task)
@@ -4,6 +4,9 @@ from typing import List, Any
 
 def get_collection_name(user_id: int):
         return f"user_pdf_documents_{user_id}"
+
+def get_section_collection_name(user_id: int):
+        return f"user_pdf_sections_{user_id}"
         
 def find_applicable_keywords(message: str, keywords: List[Any]) -> List[Any]:
     """
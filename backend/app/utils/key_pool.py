@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Each key has its own token bucket refilled at an adaptive (AIMD) rate in
+# requests per minute, starting at the rate configured per key
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+KEY_BURST_SECONDS = 2  # Bucket capacity, in seconds' worth of the key's rate
+AIMD_MIN_RATE_FRACTION = 0.1  # Never slow below this fraction of the configured rate
+AIMD_MAX_RATE_FRACTION = 1.5  # Probe up to this multiple of the configured rate
+AIMD_INCREASE_RPM = 5  # Added to the rate per minute of successful calls
+AIMD_DECREASE_FACTOR = 0.7  # Rate multiplier on throttling
+AIMD_DECREASE_COOLDOWN_SECONDS = 5  # Concurrent 429s within this window count once
+# A key that returns a 429 without a Retry-After gets no traffic for this long
+KEY_DRAIN_SECONDS = 10
+
+# Priority classes: interactive calls (answering a user who is waiting) always
+# go first; ingestion calls only use capacity interactive calls don't need
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_INGESTION = "ingestion"
+# Share of each key's bucket ingestion may not spend, so an interactive call
+# arriving during a big upload finds a token ready
+INTERACTIVE_RESERVED_FRACTION = float(os.getenv("INTERACTIVE_RESERVED_FRACTION", "0.25"))
+
+
+class PooledKey:
+    """One API key's token bucket, adaptive rate and health."""
+
+    def __init__(self, api_key: str, requests_per_minute: float):
+        self.api_key = api_key
+        self.label = f"...{api_key[-4:]}"
+        self.rate = requests_per_minute
+        self.min_rate = requests_per_minute * AIMD_MIN_RATE_FRACTION
+        self.max_rate = requests_per_minute * AIMD_MAX_RATE_FRACTION
+        self.tokens = self.capacity
+        self.drained_until = 0.0
+        self._refilled_at = time.monotonic()
+        self._last_decrease = 0.0
+        self.calls = 0
+        self.throttled = 0
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate * KEY_BURST_SECONDS / 60)
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._refilled_at) * self.rate / 60)
+        self._refilled_at = now
+
+    @property
+    def ingestion_tokens(self) -> float:
+        """
+        Tokens ingestion needs before taking one: one plus the interactive
+        reserve, which is capped so a small bucket can still reach it.
+        """
+        return 1 + min(self.capacity * INTERACTIVE_RESERVED_FRACTION, self.capacity - 1)
+
+    def seconds_until_tokens(self, tokens: float = 1.0) -> float:
+        return max(0.0, (tokens - self.tokens) * 60 / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + AIMD_INCREASE_RPM / self.rate)
+
+    def on_throttle(self, now: float, retry_after: Optional[float]):
+        self.throttled += 1
+        self.tokens = 0.0
+        self.drained_until = max(self.drained_until, now + (retry_after if retry_after is not None else KEY_DRAIN_SECONDS))
+        if now - self._last_decrease >= AIMD_DECREASE_COOLDOWN_SECONDS:
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * AIMD_DECREASE_FACTOR)
+            logger.warning(
+                f"[key_pool] Key {self.label} throttled, draining for {self.drained_until - now:.0f}s "
+                f"and lowering its rate to {self.rate:.1f} requests/minute"
+            )
+
+
+class KeyPool:
+    """
+    Spreads calls over several API keys (or projects), each with its own quota.
+
+    A call goes to the healthy key with the most tokens left; keys that were
+    just throttled are drained (given no traffic) until their Retry-After, or
+    KEY_DRAIN_SECONDS, has passed. Throughput therefore scales with the
+    number of keys.
+
+    Calls are scheduled by priority: ingestion calls leave
+    INTERACTIVE_RESERVED_FRACTION of every bucket untouched and wait while
+    any interactive call is waiting, so a queued upload never delays a
+    user's question.
+    """
+
+    def __init__(self, api_keys: List[str], requests_per_minute: float):
+        if not api_keys:
+            raise ValueError("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
+        self.keys = [PooledKey(api_key, requests_per_minute) for api_key in api_keys]
+        self._lock = Lock()
+        self._interactive_waiting = 0
+        # Priority -> calls, total and max seconds spent waiting for a key
+        self._waits: Dict[str, Dict[str, float]] = {
+            priority: {"calls": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in (PRIORITY_INTERACTIVE, PRIORITY_INGESTION)
+        }
+
+    def _take(self, priority: str, now: float) -> Tuple[Optional[PooledKey], float]:
+        """Take a token for priority, or return how long to wait before trying again."""
+        for key in self.keys:
+            key.refill(now)
+        healthy = [key for key in self.keys if key.drained_until <= now]
+        if not healthy:
+            return None, min(key.drained_until for key in self.keys) - now
+        best = max(healthy, key=lambda key: key.tokens)
+        if not RATE_LIMIT_ENABLED:
+            return best, 0.0
+        if priority == PRIORITY_INTERACTIVE:
+            if best.tokens >= 1:
+                return best, 0.0
+            return None, min(key.seconds_until_tokens() for key in healthy)
+        needed = {key: key.ingestion_tokens for key in healthy}
+        if self._interactive_waiting == 0 and best.tokens >= needed[best]:
+            return best, 0.0
+        # Retry once this key could serve both the waiting interactive calls and this one
+        return None, max(60 / best.rate, min(key.seconds_until_tokens(needed[key]) for key in healthy))
+
+    async def acquire(self, priority: str = PRIORITY_INTERACTIVE) -> PooledKey:
+        """Wait until a key has a token this priority may use, and take it."""
+        started = time.monotonic()
+        waiting = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    key, wait = self._take(priority, now)
+                    if key is not None:
+                        key.tokens -= 1
+                        key.calls += 1
+                        waits = self._waits[priority]
+                        waits["calls"] += 1
+                        waits["total_wait"] += now - started
+                        waits["max_wait"] = max(waits["max_wait"], now - started)
+                        return key
+                    if priority == PRIORITY_INTERACTIVE and not waiting:
+                        waiting = True
+                        self._interactive_waiting += 1
+                await asyncio.sleep(wait)
+        finally:
+            if waiting:
+                with self._lock:
+                    self._interactive_waiting -= 1
+
+    def on_success(self, key: PooledKey):
+        with self._lock:
+            key.on_success()
+
+    def on_throttle(self, key: PooledKey, retry_after: Optional[float] = None):
+        with self._lock:
+            key.on_throttle(time.monotonic(), retry_after)
+
+    @property
+    def rate(self) -> float:
+        """Combined requests per minute of the keys that aren't drained."""
+        now = time.monotonic()
+        return sum(key.rate for key in self.keys if key.drained_until <= now)
+
+    def priority_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                priority: {
+                    "calls": waits["calls"],
+                    "avg_wait_ms": round(waits["total_wait"] / waits["calls"] * 1000, 1) if waits["calls"] else 0.0,
+                    "max_wait_ms": round(waits["max_wait"] * 1000, 1)
+                }
+                for priority, waits in self._waits.items()
+            }
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": key.label,
+                    "calls": key.calls,
+                    "throttled": key.throttled,
+                    "rate_per_minute": round(key.rate, 1),
+                    "drained_for_seconds": round(max(0.0, key.drained_until - now), 1)
+                }
+                for key in self.keys
+            ]
@@ -0,0 +1,94 @@
+import json
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.llm.config import get_embeddings
+from app.models.keyword_embedding import KeywordEmbedding
+from app.utils.key_pool import PRIORITY_INTERACTIVE
+from app.utils.resilience import embedding_caller
+
+logger = logging.getLogger(__name__)
+
+# Example texts embedded per request (the embedding API accepts up to 100 texts)
+KEYWORD_EMBED_BATCH_SIZE = 100
+
+
+async def store_keyword_embeddings(db: Session, keywords: List[Any], priority: str = PRIORITY_INTERACTIVE) -> Dict[int, List[float]]:
+    """
+    Embed the example text of the given keywords in batched calls of up to
+    KEYWORD_EMBED_BATCH_SIZE texts and store the vectors, replacing any
+    previous ones. Calls go through the embedding caller (key pool, retries,
+    circuit breaker).
+
+    Args:
+        db: Database session (committed here)
+        keywords: Keywords with id, user_id and example_text
+        priority: Key pool scheduling class of the embedding calls
+
+    Returns:
+        Dict[int, List[float]]: Embedding per keyword id
+    """
+    keywords = [keyword for keyword in keywords if keyword.example_text]
+    if not keywords:
+        return {}
+
+    vectors = []
+    for batch_start in range(0, len(keywords), KEYWORD_EMBED_BATCH_SIZE):
+        batch = keywords[batch_start:batch_start + KEYWORD_EMBED_BATCH_SIZE]
+        texts = [keyword.example_text for keyword in batch]
+        vectors.extend(await embedding_caller.call(
+            lambda api_key: get_embeddings(api_key).embed_documents(texts),
+            priority=priority
+        ))
+    for keyword, vector in zip(keywords, vectors):
+        db.merge(KeywordEmbedding(
+            keyword_id=keyword.id,
+            user_id=keyword.user_id,
+            example_text=keyword.example_text,
+            embedding=json.dumps(vector)
+        ))
+    db.commit()
+    logger.info(f"[keyword_embeddings] Stored {len(keywords)} keyword embeddings")
+    return {keyword.id: vector for keyword, vector in zip(keywords, vectors)}
+
+
+async def get_keyword_embeddings(db: Session, keywords: List[Any]) -> Dict[int, List[float]]:
+    """
+    Load the stored example-text embeddings for the given keywords.
+
+    Keywords with no stored embedding, or whose example text changed since it
+    was stored, are embedded (in batched calls) and stored on the way.
+
+    Returns:
+        Dict[int, List[float]]: Embedding per keyword id
+    """
+    if not keywords:
+        return {}
+
+    rows = db.query(KeywordEmbedding).filter(
+        KeywordEmbedding.keyword_id.in_([keyword.id for keyword in keywords])
+    ).all()
+    stored = {row.keyword_id: row for row in rows}
+
+    vectors = {}
+    stale = []
+    for keyword in keywords:
+        row = stored.get(keyword.id)
+        if row is not None and row.example_text == keyword.example_text:
+            vectors[keyword.id] = json.loads(row.embedding)
+        else:
+            stale.append(keyword)
+
+    if stale:
+        try:
+            vectors.update(await store_keyword_embeddings(db, stale))
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[keyword_embeddings] Error embedding {len(stale)} keywords: {str(e)}")
+    return vectors
+
+
+def delete_keyword_embedding(db: Session, keyword_id: int):
+    db.query(KeywordEmbedding).filter(KeywordEmbedding.keyword_id == keyword_id).delete()
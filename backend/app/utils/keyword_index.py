@@ -0,0 +1,44 @@
+import logging
+from typing import Any, List, Optional
+
+from app.utils import lexical_index
+from app.utils.keyword_matcher import KeywordPhraseMatcher, normalize_phrase_text
+
+logger = logging.getLogger(__name__)
+
+
+def index_chunk(user_id: int, matcher: KeywordPhraseMatcher, chunk_id: str, text: str, document_id: Optional[str] = None) -> int:
+    """
+    Add a newly ingested chunk to the keyword inverted index.
+
+    Returns:
+        int: Number of keywords whose target phrases the chunk contains
+    """
+    matched = matcher.match(normalize_phrase_text(text))
+    lexical_index.add_keyword_chunks(user_id, [(keyword.id, chunk_id, document_id) for keyword in matched])
+    return len(matched)
+
+
+def index_keywords(user_id: int, keywords: List[Any]):
+    """
+    (Re)index already ingested chunks for new or changed keywords.
+
+    FTS5 narrows the scan to chunks containing any of the keywords' phrases;
+    the phrase matcher then confirms exact, whole-word matches and attributes
+    them to keywords in a single pass per chunk.
+    """
+    if not keywords:
+        return
+    lexical_index.delete_keyword_chunks(user_id, [keyword.id for keyword in keywords])
+
+    matcher = KeywordPhraseMatcher(keywords)
+    phrases = [phrase for keyword in keywords for phrase in matcher.terms_for(keyword)]
+    rows = []
+    for chunk_id, document_id, text in lexical_index.scan_chunks(user_id, lexical_index.build_phrase_query(phrases)):
+        rows.extend((keyword.id, chunk_id, document_id) for keyword in matcher.match(normalize_phrase_text(text)))
+    lexical_index.add_keyword_chunks(user_id, rows)
+    logger.info(f"[keyword_index] Indexed {len(rows)} keyword/chunk pairs for {len(keywords)} keywords, user_id={user_id}")
+
+
+def delete_keywords(user_id: int, keyword_ids: List[int]):
+    lexical_index.delete_keyword_chunks(user_id, keyword_ids)
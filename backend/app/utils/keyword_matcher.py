@@ -0,0 +1,183 @@
+import logging
+import re
+import string
+from collections import deque
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.keyword import Keyword
+from app.schemas.keyword import Keyword as KeywordSchema
+from app.utils.corpus_version import get_keyword_version, register_invalidation_callback
+
+logger = logging.getLogger(__name__)
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _at_word_boundary(text: str, position: int) -> bool:
+    """Equivalent of a regex \\b assertion at position in text."""
+    before = position > 0 and _is_word_char(text[position - 1])
+    after = position < len(text) and _is_word_char(text[position])
+    return before != after
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over a user's keyword terms.
+
+    Finds every keyword whose term occurs as a whole word in a message in a
+    single pass over the message, instead of one regex search per keyword.
+    Matching is case-insensitive and uses the same word-boundary rules as
+    find_applicable_keywords.
+    """
+
+    def __init__(self, keywords: List[Any]):
+        self.keywords = list(keywords)
+        # Trie as parallel lists: goto transitions, failure links and the
+        # (term length, keyword indices) outputs for each state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[int, List[int]]]] = [[]]
+
+        term_keywords: Dict[str, List[int]] = {}
+        for index, keyword in enumerate(self.keywords):
+            for term in self.terms_for(keyword):
+                term_keywords.setdefault(term, []).append(index)
+
+        for term, indices in term_keywords.items():
+            self._add_term(term, indices)
+        self._build_failure_links()
+
+    def terms_for(self, keyword: Any) -> List[str]:
+        """Lowercased strings that make a keyword match."""
+        term = keyword.term.lower() if keyword and isinstance(getattr(keyword, "term", None), str) else ""
+        return [term] if term else []
+
+    def _add_term(self, term: str, indices: List[int]):
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._outputs[state].append((len(term), indices))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # Inherit outputs of the suffix state so overlapping terms are reported
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def match(self, message: str) -> List[Any]:
+        """
+        Return the keywords whose term appears as a whole word in message,
+        in the order the keywords were given.
+        """
+        if not message or len(self._goto) == 1:
+            return []
+
+        text = message.lower()
+        matched = set()
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for term_length, indices in self._outputs[state]:
+                end = position + 1
+                start = end - term_length
+                if _at_word_boundary(text, start) and _at_word_boundary(text, end):
+                    matched.update(indices)
+
+        return [self.keywords[index] for index in sorted(matched)]
+
+
+def normalize_phrase_text(text: str) -> str:
+    """Collapse whitespace (PDF text breaks lines mid-phrase) before phrase matching."""
+    return re.sub(r"\s+", " ", text)
+
+
+class KeywordPhraseMatcher(KeywordMatcher):
+    """
+    Matches keywords by the comma-separated target phrases in their
+    example_text ("ACCEPTABLE MANUFACTURERS:,Base of design:") rather than
+    their term. Used to find the chunks each keyword points at.
+    """
+
+    def terms_for(self, keyword: Any) -> List[str]:
+        example_text = getattr(keyword, "example_text", None) or ""
+        terms = []
+        for phrase in example_text.split(","):
+            # Trailing colons etc. would defeat the word boundary check
+            phrase = normalize_phrase_text(phrase).strip().strip(string.punctuation).strip().lower()
+            if phrase and phrase not in terms:
+                terms.append(phrase)
+        return terms
+
+
+# Compiled matchers per user, tagged with the keyword version they were built from
+_matchers: Dict[int, Tuple[int, KeywordMatcher]] = {}
+_phrase_matchers: Dict[int, Tuple[int, KeywordPhraseMatcher]] = {}
+_matchers_lock = Lock()
+
+
+def get_keyword_matcher(user_id: int, db: Session) -> KeywordMatcher:
+    """
+    Get the user's compiled keyword matcher, loading keywords from the
+    database and rebuilding only when the user's keyword set has changed.
+    """
+    version = get_keyword_version(user_id)
+    cached = _matchers.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    user_keywords = db.query(Keyword).filter(Keyword.user_id == user_id).all()
+    # Detach from the session so cached entries stay usable across requests
+    matcher = KeywordMatcher([KeywordSchema.from_orm(keyword) for keyword in user_keywords])
+    with _matchers_lock:
+        _matchers[user_id] = (version, matcher)
+    logger.info(f"[keyword_matcher] Built matcher for user_id={user_id} with {len(user_keywords)} keywords (version {version})")
+    return matcher
+
+
+def get_keyword_phrase_matcher(user_id: int, db: Session) -> KeywordPhraseMatcher:
+    """
+    Get the user's compiled phrase matcher, rebuilt only when the user's
+    keyword set has changed. Cheap to call per chunk, so long ingestions
+    pick up keywords created, edited or deleted while they run.
+    """
+    version = get_keyword_version(user_id)
+    cached = _phrase_matchers.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    matcher = KeywordPhraseMatcher(get_keyword_matcher(user_id, db).keywords)
+    with _matchers_lock:
+        _phrase_matchers[user_id] = (version, matcher)
+    return matcher
+
+
+def invalidate_keyword_matcher(user_id: int):
+    with _matchers_lock:
+        _matchers.pop(user_id, None)
+        _phrase_matchers.pop(user_id, None)
+
+
+register_invalidation_callback(
+    lambda user_id, kind: invalidate_keyword_matcher(user_id) if kind == "keywords" else None
+)
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.database.database import DB_DIR
+
+logger = logging.getLogger(__name__)
+
+# The lexical index lives next to sql_app.db
+LEXICAL_DB_PATH = os.getenv("LEXICAL_DB_PATH", os.path.join(DB_DIR, "lexical_index.db"))
+
+# Words that carry no signal for BM25 over construction documents
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "in", "is", "it", "of", "on", "or", "should", "that", "the", "this", "to",
+    "what", "when", "where", "which", "who", "why", "with", "will", "any", "there", "these"
+}
+
+# CSI MasterFormat section numbers such as "26 51 00" or "08 71 00.13"
+SECTION_NUMBER_PATTERN = re.compile(r"\b\d{2}\s\d{2}\s\d{2}(?:\.\d{2})?\b")
+TOKEN_PATTERN = re.compile(r"\w+")
+
+_connection: Optional[sqlite3.Connection] = None
+_connection_lock = Lock()
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(LEXICAL_DB_PATH, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        logger.info(f"[lexical_index] Using lexical index at {LEXICAL_DB_PATH}")
+    return _connection
+
+
+def _table_name(user_id: int) -> str:
+    return f"chunk_fts_{int(user_id)}"
+
+
+def _ensure_table(connection: sqlite3.Connection, user_id: int):
+    connection.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {_table_name(user_id)} USING fts5("
+        "chunk_id UNINDEXED, document_id UNINDEXED, metadata UNINDEXED, text, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def _ensure_section_table(connection: sqlite3.Connection):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS section_chunks ("
+        "user_id INTEGER NOT NULL, section_number TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+        "document_id TEXT, chunk_num INTEGER)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_section_chunks_lookup ON section_chunks (user_id, section_number)"
+    )
+
+
+def _ensure_keyword_table(connection: sqlite3.Connection):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS keyword_chunks ("
+        "user_id INTEGER NOT NULL, keyword_id INTEGER NOT NULL, chunk_id TEXT NOT NULL, document_id TEXT)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_keyword_chunks_lookup ON keyword_chunks (user_id, keyword_id)"
+    )
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_match_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Section numbers are kept together as phrases, remaining tokens are quoted
+    (so punctuation and FTS operators in user input are harmless) and OR-ed so
+    BM25 ranks chunks by how many rare terms they contain.
+    """
+    terms = []
+    for section in SECTION_NUMBER_PATTERN.findall(text):
+        terms.append(_quote(section))
+    remainder = SECTION_NUMBER_PATTERN.sub(" ", text)
+    for token in TOKEN_PATTERN.findall(remainder.lower()):
+        if token in STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        terms.append(_quote(token))
+    # Preserve order but drop duplicates
+    return " OR ".join(dict.fromkeys(terms))
+
+
+def build_phrase_query(phrases: List[str]) -> str:
+    """Build an FTS5 MATCH expression that matches any of the given phrases."""
+    terms = []
+    for phrase in phrases:
+        tokens = TOKEN_PATTERN.findall(phrase.lower())
+        if tokens:
+            terms.append(_quote(" ".join(tokens)))
+    return " OR ".join(dict.fromkeys(terms))
+
+
+def add_chunk(user_id: int, chunk_id: str, text: str, metadata: Dict[str, Any], document_id: Optional[str] = None):
+    """Index a chunk's text for lexical search."""
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_table(connection, user_id)
+        connection.execute(
+            f"INSERT INTO {_table_name(user_id)} (chunk_id, document_id, metadata, text) VALUES (?, ?, ?, ?)",
+            (chunk_id, document_id, json.dumps(metadata), text)
+        )
+        connection.commit()
+
+
+def _run_match(user_id: int, match_query: str, limit: int, chunk_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    if not match_query:
+        return []
+    table = _table_name(user_id)
+    sql = f"SELECT chunk_id, metadata, text, bm25({table}) AS score FROM {table} WHERE {table} MATCH ?"
+    params: List[Any] = [match_query]
+    if chunk_ids is not None:
+        sql += f" AND chunk_id IN ({', '.join('?' for _ in chunk_ids)})"
+        params.extend(chunk_ids)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(limit)
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_table(connection, user_id)
+        try:
+            rows = connection.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error(f"[lexical_index] Query failed for user_id={user_id}: {str(e)}")
+            return []
+    return [
+        {
+            "id": chunk_id,
+            "metadata": json.loads(metadata) if metadata else {},
+            "text": text,
+            "score": score
+        }
+        for chunk_id, metadata, text, score in rows
+    ]
+
+
+def search(user_id: int, text: str, limit: int = 5, chunk_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    BM25 search over a user's chunks, optionally restricted to the given chunk ids.
+
+    Returns:
+        List of dicts with id, metadata, text and score (lower is better),
+        best match first
+    """
+    return _run_match(user_id, build_match_query(text), limit, chunk_ids)
+
+
+def search_phrases(user_id: int, phrases: List[str], limit: int = 3) -> List[Dict[str, Any]]:
+    """BM25 search for chunks containing any of the given exact phrases."""
+    return _run_match(user_id, build_phrase_query(phrases), limit)
+
+
+def add_section_chunk(user_id: int, section_numbers: List[str], chunk_id: str, chunk_num: int, document_id: Optional[str] = None):
+    """Record which CSI sections a chunk belongs to, for exact section lookups."""
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_section_table(connection)
+        connection.executemany(
+            "INSERT INTO section_chunks (user_id, section_number, chunk_id, document_id, chunk_num) VALUES (?, ?, ?, ?, ?)",
+            [(user_id, section_number, chunk_id, document_id, chunk_num) for section_number in section_numbers]
+        )
+        connection.commit()
+
+
+def get_section_chunk_ids(user_id: int, section_numbers: List[str]) -> List[str]:
+    """
+    Look up the chunks belonging to the given sections.
+
+    Returns:
+        List[str]: Chunk ids grouped by section (in the order given), in
+        document order within each section
+    """
+    if not section_numbers:
+        return []
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_section_table(connection)
+        chunk_ids = []
+        for section_number in section_numbers:
+            rows = connection.execute(
+                "SELECT chunk_id FROM section_chunks WHERE user_id = ? AND section_number = ? "
+                "ORDER BY document_id, chunk_num",
+                (user_id, section_number)
+            ).fetchall()
+            chunk_ids.extend(chunk_id for (chunk_id,) in rows if chunk_id not in chunk_ids)
+    return chunk_ids
+
+
+def scan_chunks(user_id: int, match_query: str) -> List[Tuple[str, Optional[str], str]]:
+    """
+    Candidate chunks for an FTS5 MATCH expression, unranked.
+
+    Returns:
+        List of (chunk id, document id, text) tuples
+    """
+    if not match_query:
+        return []
+    table = _table_name(user_id)
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_table(connection, user_id)
+        try:
+            return connection.execute(
+                f"SELECT chunk_id, document_id, text FROM {table} WHERE {table} MATCH ?",
+                (match_query,)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error(f"[lexical_index] Scan failed for user_id={user_id}: {str(e)}")
+            return []
+
+
+def add_keyword_chunks(user_id: int, rows: List[Tuple[int, str, Optional[str]]]):
+    """Record (keyword id, chunk id, document id) rows of the keyword inverted index."""
+    if not rows:
+        return
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_keyword_table(connection)
+        connection.executemany(
+            "INSERT INTO keyword_chunks (user_id, keyword_id, chunk_id, document_id) VALUES (?, ?, ?, ?)",
+            [(user_id, keyword_id, chunk_id, document_id) for keyword_id, chunk_id, document_id in rows]
+        )
+        connection.commit()
+
+
+def get_keyword_chunk_ids(user_id: int, keyword_id: int) -> List[str]:
+    """Chunks containing one of the keyword's target phrases."""
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_keyword_table(connection)
+        rows = connection.execute(
+            "SELECT DISTINCT chunk_id FROM keyword_chunks WHERE user_id = ? AND keyword_id = ?",
+            (user_id, keyword_id)
+        ).fetchall()
+    return [chunk_id for (chunk_id,) in rows]
+
+
+def delete_keyword_chunks(user_id: int, keyword_ids: List[int]):
+    if not keyword_ids:
+        return
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_keyword_table(connection)
+        connection.execute(
+            f"DELETE FROM keyword_chunks WHERE user_id = ? AND keyword_id IN ({', '.join('?' for _ in keyword_ids)})",
+            [user_id, *keyword_ids]
+        )
+        connection.commit()
+
+
+def delete_document(user_id: int, document_id: str):
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_table(connection, user_id)
+        _ensure_section_table(connection)
+        _ensure_keyword_table(connection)
+        connection.execute(f"DELETE FROM {_table_name(user_id)} WHERE document_id = ?", (document_id,))
+        connection.execute("DELETE FROM section_chunks WHERE user_id = ? AND document_id = ?", (user_id, document_id))
+        connection.execute("DELETE FROM keyword_chunks WHERE user_id = ? AND document_id = ?", (user_id, document_id))
+        connection.commit()
+
+
+def delete_user(user_id: int):
+    with _connection_lock:
+        connection = _get_connection()
+        _ensure_section_table(connection)
+        _ensure_keyword_table(connection)
+        connection.execute(f"DROP TABLE IF EXISTS {_table_name(user_id)}")
+        connection.execute("DELETE FROM section_chunks WHERE user_id = ?", (user_id,))
+        connection.execute("DELETE FROM keyword_chunks WHERE user_id = ?", (user_id,))
+        connection.commit()
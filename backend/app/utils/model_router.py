@@ -0,0 +1,150 @@
+import logging
+import os
+import re
+from threading import Lock
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from app.llm.config import FAST_CHAT_MODEL, LARGE_CHAT_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Routes: chit-chat skips retrieval, simple lookups use the fast model with a
+# small output cap, and only hard questions go to the large model
+ROUTE_CHIT_CHAT = "chit_chat"
+ROUTE_SIMPLE = "simple"
+ROUTE_COMPLEX = "complex"
+
+ROUTES = {
+    ROUTE_CHIT_CHAT: {"model": FAST_CHAT_MODEL, "max_output_tokens": 256},
+    ROUTE_SIMPLE: {"model": FAST_CHAT_MODEL, "max_output_tokens": 1024},
+    ROUTE_COMPLEX: {"model": LARGE_CHAT_MODEL, "max_output_tokens": None}
+}
+
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+
+# A question is escalated to the large model when any of these is reached
+COMPLEX_MIN_WORDS = 40
+COMPLEX_MIN_KEYWORDS = 3
+# Retrieval confidence: a best vector hit farther than this (squared L2 between
+# normalized embeddings, 0.7 is a cosine similarity of 0.65) means nothing in
+# the documents clearly answers the question
+COMPLEX_MIN_BEST_DISTANCE = float(os.getenv("ROUTE_LOW_CONFIDENCE_DISTANCE", "0.7"))
+# When the top fused chunk leads the runner-up by less than this share of its
+# score, the retrievers don't agree on where the answer is
+COMPLEX_MAX_FUSED_MARGIN = 0.1
+# Only then does context drawn from several sections, with none supplying at
+# least this share of the chunks, mean the answer has to be assembled from
+# scattered sources (MMR spreads confident context over sections too)
+COMPLEX_MIN_SECTIONS = 3
+COMPLEX_MAX_DOMINANT_SHARE = 0.5
+
+# Whole messages that need no document context
+CHIT_CHAT_PATTERN = re.compile(
+    r"^(hi|hello|hey|howdy|yo|good (morning|afternoon|evening)|thanks|thank you|thx|ok|okay|cool|great|"
+    r"bye|goodbye|who are you|what are you|what can you do|how are you)( there| shipwright)?[\s!.?,]*$",
+    re.IGNORECASE
+)
+# Wording that asks for synthesis across the documents
+COMPLEX_CUE_PATTERN = re.compile(
+    r"\b(compare|comparison|difference|differences|differ|versus|vs\.?|conflict|conflicts|inconsisten\w*|"
+    r"summarize|summary of|all of the|every|list all|across)\b",
+    re.IGNORECASE
+)
+
+
+def classify_message(message: str, applicable_keywords: List[Any]) -> Optional[str]:
+    """
+    Cheap pre-retrieval check for chit-chat.
+
+    Returns:
+        ROUTE_CHIT_CHAT when the message needs no retrieval, otherwise None
+    """
+    if not MODEL_ROUTING_ENABLED or applicable_keywords:
+        return None
+    if CHIT_CHAT_PATTERN.match(message.strip()):
+        return ROUTE_CHIT_CHAT
+    return None
+
+
+def classify_question(
+    message: str,
+    applicable_keywords: List[Any],
+    packed_chunks: List[Dict[str, Any]],
+    pack_stats: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Post-retrieval routing from the message, matched keywords and retrieval
+    confidence: a weak best vector hit escalates, and so does context
+    scattered across sections when the retrievers don't agree on a top chunk.
+
+    Args:
+        pack_stats: Packing stats of the context; "best_distance" and
+            "fused_margin" are set by hybrid retrieval (section lookups, which
+            the question asked for by number, have neither and count as confident)
+
+    Returns:
+        ROUTE_SIMPLE or ROUTE_COMPLEX
+    """
+    if not MODEL_ROUTING_ENABLED:
+        return ROUTE_SIMPLE
+    if (
+        len(message.split()) >= COMPLEX_MIN_WORDS
+        or len(applicable_keywords) >= COMPLEX_MIN_KEYWORDS
+        or COMPLEX_CUE_PATTERN.search(message)
+    ):
+        return ROUTE_COMPLEX
+
+    pack_stats = pack_stats or {}
+    best_distance = pack_stats.get("best_distance")
+    if best_distance is not None and best_distance > COMPLEX_MIN_BEST_DISTANCE:
+        return ROUTE_COMPLEX
+    fused_margin = pack_stats.get("fused_margin")
+    if fused_margin is None or fused_margin >= COMPLEX_MAX_FUSED_MARGIN or not packed_chunks:
+        return ROUTE_SIMPLE
+    sources = Counter(
+        chunk["metadata"].get("section_number") or chunk["metadata"].get("document_id") or chunk["metadata"].get("filename")
+        for chunk in packed_chunks
+    )
+    scattered = (
+        len(sources) >= COMPLEX_MIN_SECTIONS
+        and max(sources.values()) / len(packed_chunks) < COMPLEX_MAX_DOMINANT_SHARE
+    )
+    return ROUTE_COMPLEX if scattered else ROUTE_SIMPLE
+
+
+class RouteMetrics:
+    """Per-route request counts, LLM latency and estimated token spend."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._routes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, route: str, latency_ms: float, prompt_tokens: int, output_tokens: int):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "requests": 0,
+                "total_latency_ms": 0.0,
+                "max_latency_ms": 0.0,
+                "prompt_tokens": 0,
+                "output_tokens": 0
+            })
+            stats["requests"] += 1
+            stats["total_latency_ms"] += latency_ms
+            stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["output_tokens"] += output_tokens
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                route: {
+                    **stats,
+                    "model": ROUTES[route]["model"],
+                    "avg_latency_ms": round(stats["total_latency_ms"] / stats["requests"], 1)
+                }
+                for route, stats in self._routes.items()
+            }
+
+
+route_metrics = RouteMetrics()
@@ -1,68 +1,30 @@
-import os
 import tempfile
 import logging
-from typing import Optional, AsyncGenerator, Dict, Any
+from typing import Callable, Optional, AsyncGenerator, Dict, Any
 import PyPDF2
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
 import io
 import chromadb
 import json
-import asyncio
-from datetime import datetime, timedelta
-from asyncio import Lock
-from app.utils.helpers import get_collection_name
+from app.utils.helpers import get_collection_name, get_section_collection_name
+from app.utils.section_index import division_for_section, detect_sections, section_for_span, sections_for_span, page_offsets, pages_for_span, build_section_summary
+from app.utils import lexical_index
+from app.utils.keyword_index import index_chunk
+from app.utils.keyword_matcher import KeywordPhraseMatcher
+from app.utils.retrieval import estimate_tokens
+from app.utils.resilience import embedding_caller
+from app.utils.key_pool import PRIORITY_INGESTION
+from app.llm.config import get_embeddings
 # Get logger
 logger = logging.getLogger(__name__)
 
-# Rate limiting configuration
-RATE_LIMIT_ENABLED = True  # Set to False to disable rate limiting
-REQUESTS_PER_MINUTE = 140  # Keep slightly under the 150 limit for safety
-REQUEST_WINDOW = 60  # seconds
-
-# Rate limiting state
-request_timestamps = []
-last_request_time = None
-rate_limit_lock = Lock()
-
-async def wait_for_rate_limit():
-    """
-    Rate limiting function that ensures we don't exceed the API limits.
-    Can be disabled by setting RATE_LIMIT_ENABLED to False.
-    """
-    if not RATE_LIMIT_ENABLED:
-        return
-        
-    global request_timestamps, last_request_time
-    
-    async with rate_limit_lock:
-        current_time = datetime.now()
-        
-        # Remove timestamps older than the window
-        request_timestamps = [ts for ts in request_timestamps 
-                            if current_time - ts < timedelta(seconds=REQUEST_WINDOW)]
-        
-        # If we've hit the limit, wait until we can make another request
-        if len(request_timestamps) >= REQUESTS_PER_MINUTE:
-            wait_time = (request_timestamps[0] + timedelta(seconds=REQUEST_WINDOW) - current_time).total_seconds()
-            if wait_time > 0:
-                logger.info(f"Rate limit reached. Waiting {wait_time:.2f} seconds...")
-                await asyncio.sleep(wait_time)
-        
-        # Add current request timestamp
-        request_timestamps.append(current_time)
-        last_request_time = current_time
+# Section summaries embedded per request (the embedding API accepts up to 100 texts)
+SECTION_EMBED_BATCH_SIZE = 100
 
 # Initialize ChromaDB client
 chroma_client = chromadb.PersistentClient(path="./data/chroma")
 
-# Initialize embeddings
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
-
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
     Extract text from PDF using PyPDF2 and add page break markers
@@ -86,9 +48,60 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         logger.error(f"Error extracting text from PDF: {str(e)}")
         raise
 
-async def process_pdf(file_content: bytes, filename: str, user_id: int) -> AsyncGenerator[Dict[str, Any], None]:
+async def index_sections(user_id: int, filename: str, document_id: Optional[str], all_text: str, sections, offsets):
+    """
+    Add one entry per CSI section (number, title, page span and an embedding
+    of the section's opening text) to the user's section collection.
+    """
+    section_collection = chroma_client.get_or_create_collection(get_section_collection_name(user_id))
+    
+    for batch_start in range(0, len(sections), SECTION_EMBED_BATCH_SIZE):
+        batch = sections[batch_start:batch_start + SECTION_EMBED_BATCH_SIZE]
+        summaries = [build_section_summary(all_text, section) for section in batch]
+        
+        section_embeddings = await embedding_caller.call(
+            lambda api_key: get_embeddings(api_key).embed_documents(summaries),
+            priority=PRIORITY_INGESTION
+        )
+        
+        metadatas = []
+        for section in batch:
+            pages = pages_for_span(offsets, section["start"], section["end"])
+            metadata = {
+                "filename": filename,
+                "section_number": section["number"],
+                "section_title": section["title"],
+                "division": division_for_section(section["number"]),
+                "page_start": min(pages) if pages else 0,
+                "page_end": max(pages) if pages else 0
+            }
+            if document_id is not None:
+                metadata["document_id"] = document_id
+            metadatas.append(metadata)
+        
+        section_collection.add(
+            embeddings=section_embeddings,
+            documents=summaries,
+            ids=[f"doc_{document_id or filename}_section_{batch_start + i}" for i in range(len(batch))],
+            metadatas=metadatas
+        )
+    
+    logger.info(f"Indexed {len(sections)} sections for {filename}")
+
+async def process_pdf(
+    file_content: bytes,
+    filename: str,
+    user_id: int,
+    document_id: Optional[str] = None,
+    get_phrase_matcher: Optional[Callable[[], KeywordPhraseMatcher]] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
     """
     Process a PDF file and create embeddings for chunks of text.
+    Chunks are also added to the user's lexical (BM25) index, tagged with the
+    CSI section they belong to, and a section-level index is built for routing.
+    When get_phrase_matcher is given, chunks are also added to the keyword
+    inverted index, each with the phrase matcher it returns at that point,
+    so keywords changed during the upload apply to the chunks after it.
     Yields progress updates during processing.
     """
     try:
@@ -114,12 +127,26 @@ async def process_pdf(file_content: bytes, filename: str, user_id: int) -> Async
         chunks = [all_text[i:i + chunk_size] for i in range(0, len(all_text), chunk_size)]
         total_chunks = len(chunks)
         
+        # Detect CSI MasterFormat section headers so chunks can be tagged with their section
+        offsets = page_offsets(page_texts)
+        sections = detect_sections(all_text)
+        logger.info(f"Detected {len(sections)} CSI sections in {filename}")
+        
         yield {
             "status": "started",
             "total_chunks": total_chunks,
             "message": f"Starting to process {total_chunks} chunks"
         }
         
+        # Ids of the chunks that will be stored, in document order, so each chunk
+        # can record its previous and next neighbor
+        stored_chunk_ids = [
+            f"doc_{filename}_chunk_{chunk_num}"
+            for chunk_num, chunk in enumerate(chunks, 1)
+            if chunk and len(chunk.strip()) >= 10
+        ]
+        chunk_positions = {chunk_id: position for position, chunk_id in enumerate(stored_chunk_ids)}
+        
         # Process each chunk
         processed_chunks = 0
         skipped_chunks = 0
@@ -138,50 +165,67 @@ async def process_pdf(file_content: bytes, filename: str, user_id: int) -> Async
                     }
                     continue
                 
-                # Find which pages this chunk contains
+                # Find which pages and section this chunk contains
                 chunk_start = (chunk_num - 1) * chunk_size
                 chunk_end = chunk_start + len(chunk)
-                current_pos = 0
-                chunk_pages = []
-                
-                for page_num, page_text in page_texts:
-                    page_start = current_pos
-                    page_end = current_pos + len(page_text)
-                    
-                    # Check if this chunk overlaps with this page
-                    if (chunk_start < page_end and chunk_end > page_start):
-                        chunk_pages.append(page_num)
-                    
-                    current_pos += len(page_text) + 1  # +1 for the newline we added
+                chunk_pages = pages_for_span(offsets, chunk_start, chunk_end)
+                chunk_section = section_for_span(sections, chunk_start, chunk_end)
                 
-                # Wait for rate limit before making API call
-                await wait_for_rate_limit()
-                
-                # Generate embedding
-                try:
-                    embedding = embeddings.embed_query(chunk)
-                except Exception as e:
-                    if "429" in str(e):  # Rate limit error
-                        logger.warning("Rate limit hit, waiting and retrying...")
-                        await asyncio.sleep(60)  # Wait a minute
-                        await wait_for_rate_limit()  # Wait for our rate limiter
-                        embedding = embeddings.embed_query(chunk)
-                    else:
-                        raise
+                # Generate embedding (paced to the adaptive rate limit and retried on throttling).
+                # Ingestion yields the shared embedding quota to interactive /ask traffic.
+                embedding = await embedding_caller.call(
+                    lambda api_key: get_embeddings(api_key).embed_query(chunk),
+                    priority=PRIORITY_INGESTION
+                )
                 
                 # Add to ChromaDB with page numbers in metadata
+                chunk_id = f"doc_{filename}_chunk_{chunk_num}"
+                metadata = {
+                    "filename": filename,
+                    "chunk": chunk_num,
+                    "user_id": user_id,
+                    # Chroma metadata values must be scalars, so pages are stored comma separated
+                    "pages": ",".join(str(page) for page in chunk_pages),
+                    # Scalar page span so retrieval can filter by page range
+                    "page_start": min(chunk_pages) if chunk_pages else 0,
+                    "page_end": max(chunk_pages) if chunk_pages else 0,
+                    "token_count": estimate_tokens(chunk)
+                }
+                if document_id is not None:
+                    metadata["document_id"] = document_id
+                position = chunk_positions[chunk_id]
+                if position > 0:
+                    metadata["prev_chunk_id"] = stored_chunk_ids[position - 1]
+                if position < len(stored_chunk_ids) - 1:
+                    metadata["next_chunk_id"] = stored_chunk_ids[position + 1]
+                if chunk_section is not None:
+                    metadata["section_number"] = chunk_section["number"]
+                    metadata["section_title"] = chunk_section["title"]
+                    metadata["division"] = division_for_section(chunk_section["number"])
                 collection.add(
                     embeddings=[embedding],
                     documents=[chunk],
-                    ids=[f"doc_{filename}_chunk_{chunk_num}"],
-                    metadatas=[{
-                        "filename": filename,
-                        "chunk": chunk_num,
-                        "user_id": user_id,
-                        "pages": chunk_pages
-                    }]
+                    ids=[chunk_id],
+                    metadatas=[metadata]
                 )
                 
+                # Index the same chunk for lexical search
+                lexical_index.add_chunk(user_id, chunk_id, chunk, metadata, document_id=document_id)
+                
+                # Map every section this chunk overlaps to it, for exact section lookups
+                overlapping_sections = sections_for_span(sections, chunk_start, chunk_end)
+                if overlapping_sections:
+                    lexical_index.add_section_chunk(
+                        user_id,
+                        [section["number"] for section in overlapping_sections],
+                        chunk_id,
+                        chunk_num,
+                        document_id=document_id
+                    )
+                
+                if get_phrase_matcher is not None:
+                    index_chunk(user_id, get_phrase_matcher(), chunk_id, chunk, document_id=document_id)
+                
                 processed_chunks += 1
                 
                 # Yield progress update
@@ -203,6 +247,14 @@ async def process_pdf(file_content: bytes, filename: str, user_id: int) -> Async
                 }
                 continue
         
+        # Build the section-level index used to route questions to sections
+        if sections:
+            try:
+                await index_sections(user_id, filename, document_id, all_text, sections, offsets)
+            except Exception as e:
+                # Chunks are already searchable; routing just falls back to a full search
+                logger.error(f"Error indexing sections for {filename}: {str(e)}")
+        
         yield {
             "status": "complete",
             "total_chunks": total_chunks,
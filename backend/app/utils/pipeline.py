@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimeout(Exception):
+    """A pipeline stage did not finish within its timeout or the request deadline."""
+
+    def __init__(self, stage: str, timeout: float, deadline: bool = False):
+        if deadline:
+            super().__init__(f"Request deadline reached during stage '{stage}'")
+        else:
+            super().__init__(f"Stage '{stage}' timed out after {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+        self.deadline = deadline
+
+
+class StageTimer:
+    """
+    Runs the stages of a request pipeline and records when each started and
+    finished, so concurrent stages can be awaited with asyncio.gather and the
+    critical path reported afterwards.
+
+    Blocking stages (embedding calls, Chroma, SQLite) run in a worker thread;
+    coroutine functions are awaited directly. An optional request deadline
+    caps every stage's timeout at the time the request has left.
+    """
+
+    def __init__(self, deadline_seconds: Optional[float] = None):
+        self.started_at = time.perf_counter()
+        self.deadline = self.started_at + deadline_seconds if deadline_seconds is not None else None
+        # Stage name -> (start ms, end ms, dependency names), offsets from started_at
+        self.stages: Dict[str, Tuple[float, float, Tuple[str, ...]]] = {}
+
+    def _offset_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    async def run(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        deps: Iterable[str] = (),
+        **kwargs
+    ) -> Any:
+        """
+        Run one stage.
+
+        Args:
+            name: Stage name used in timings
+            func: Blocking function or coroutine function
+            timeout: Seconds before StageTimeout is raised (None waits forever,
+                or until the request deadline)
+            deps: Names of the stages whose results this stage consumes
+
+        Raises:
+            StageTimeout: If the stage exceeds its timeout or the deadline. A
+                coroutine stage is cancelled; a blocking stage's worker thread
+                is abandoned, not interrupted.
+        """
+        remaining = self.remaining_seconds()
+        deadline_bound = remaining is not None and (timeout is None or remaining < timeout)
+        if deadline_bound:
+            if remaining <= 0:
+                raise StageTimeout(name, 0, deadline=True)
+            timeout = remaining
+
+        start = self._offset_ms()
+        if asyncio.iscoroutinefunction(func):
+            awaitable = func(*args, **kwargs)
+        else:
+            awaitable = asyncio.to_thread(func, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise StageTimeout(name, timeout, deadline=deadline_bound)
+        finally:
+            self.stages[name] = (start, self._offset_ms(), tuple(deps))
+
+    async def run_optional(self, name: str, default: Any, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a stage the pipeline can do without: on timeout, log and return
+        default instead of raising.
+        """
+        try:
+            return await self.run(name, func, *args, **kwargs)
+        except StageTimeout as e:
+            logger.warning(f"[pipeline] {str(e)}, continuing without it")
+            return default
+
+    def remaining_seconds(self) -> Optional[float]:
+        """Seconds left before the request deadline, or None without a deadline."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.perf_counter()
+
+    def duration_ms(self, name: str) -> float:
+        start, end, _ = self.stages[name]
+        return end - start
+
+    def elapsed_ms(self) -> float:
+        return self._offset_ms()
+
+    def critical_path(self) -> List[Tuple[str, float]]:
+        """
+        The chain of stages that determined the total latency: starting from
+        the stage that finished last, repeatedly step to the dependency that
+        finished last.
+
+        Returns:
+            List of (stage name, duration ms) in execution order
+        """
+        if not self.stages:
+            return []
+        path = []
+        name = max(self.stages, key=lambda stage: self.stages[stage][1])
+        while name is not None:
+            start, end, deps = self.stages[name]
+            path.append((name, end - start))
+            finished_deps = [dep for dep in deps if dep in self.stages]
+            name = max(finished_deps, key=lambda dep: self.stages[dep][1]) if finished_deps else None
+        return list(reversed(path))
+
+    def log_summary(self, prefix: str):
+        """Log per-stage durations and the critical path."""
+        stages = ", ".join(
+            f"{name} {end - start:.0f}ms"
+            for name, (start, end, _) in sorted(self.stages.items(), key=lambda item: item[1][0])
+        )
+        path = " -> ".join(f"{name} {duration:.0f}ms" for name, duration in self.critical_path())
+        logger.info(f"{prefix} Stages: {stages}")
+        logger.info(f"{prefix} Critical path ({self.elapsed_ms():.0f}ms total): {path}")
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from threading import Lock
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from app.llm.config import GOOGLE_API_KEYS
+from app.utils.key_pool import PRIORITY_INTERACTIVE, KeyPool, PooledKey
+
+logger = logging.getLogger(__name__)
+
+# Gemini call resilience configuration. Rates are requests per minute per API
+# key; the key pool adapts each key's rate to the throttling it sees
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "140"))
+CHAT_REQUESTS_PER_MINUTE = float(os.getenv("CHAT_REQUESTS_PER_MINUTE", "300"))
+
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+EMBEDDING_MAX_RETRIES = 5
+CHAT_MAX_RETRIES = 2
+
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive provider failures that open the circuit
+CIRCUIT_RESET_SECONDS = 30  # Time the circuit stays open before a trial call
+
+# Error classes
+ERROR_RATE_LIMITED = "rate_limited"
+ERROR_TRANSIENT = "transient"
+ERROR_FATAL = "fatal"
+
+RATE_LIMITED_EXCEPTIONS = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)
+TRANSIENT_EXCEPTIONS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError
+)
+# The LangChain wrappers re-raise provider errors as generic exceptions, so
+# the message is checked when the type says nothing
+RATE_LIMITED_PATTERN = re.compile(r"\b429\b|resource.?exhausted|quota|rate.?limit", re.IGNORECASE)
+TRANSIENT_PATTERN = re.compile(
+    r"\b(500|502|503|504)\b|unavailable|internal error|deadline exceeded|timed out|connection (reset|aborted|refused)",
+    re.IGNORECASE
+)
+RETRY_DELAY_PATTERN = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)|retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+
+def _error_chain(error: BaseException):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Classify a failed provider call.
+
+    Returns:
+        ERROR_RATE_LIMITED for quota/throttling errors, ERROR_TRANSIENT for
+        errors worth retrying (5xx, timeouts, dropped connections), otherwise
+        ERROR_FATAL
+    """
+    for cause in _error_chain(error):
+        if isinstance(cause, RATE_LIMITED_EXCEPTIONS):
+            return ERROR_RATE_LIMITED
+        if isinstance(cause, TRANSIENT_EXCEPTIONS):
+            return ERROR_TRANSIENT
+    message = str(error)
+    if RATE_LIMITED_PATTERN.search(message):
+        return ERROR_RATE_LIMITED
+    if TRANSIENT_PATTERN.search(message):
+        return ERROR_TRANSIENT
+    return ERROR_FATAL
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    The provider's requested wait before retrying: an HTTP Retry-After header,
+    a RetryInfo detail, or a delay quoted in the error message.
+    """
+    for cause in _error_chain(error):
+        response = getattr(cause, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is not None:
+            value = headers.get("Retry-After")
+            if value is not None:
+                try:
+                    return max(0.0, float(value))
+                except ValueError:
+                    pass
+        for detail in getattr(cause, "details", None) or []:
+            retry_delay = getattr(detail, "retry_delay", None)
+            if retry_delay is not None:
+                return retry_delay.seconds + retry_delay.nanos / 1e9
+        match = RETRY_DELAY_PATTERN.search(str(cause))
+        if match:
+            return float(match.group(1) or match.group(2))
+    return None
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_SECONDS, cap: float = RETRY_MAX_SECONDS) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitOpenError(Exception):
+    """Calls to a provider are being refused because it looks down."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after CIRCUIT_FAILURE_THRESHOLD consecutive provider failures and
+    refuses calls for CIRCUIT_RESET_SECONDS; then one trial call is let
+    through, and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self._half_open else "open"
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial
+                call already in flight
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited < self.reset_seconds:
+                raise CircuitOpenError(self.name, self.reset_seconds - waited)
+            # Let this call through as the trial; the others keep failing fast
+            # until it resolves (or another reset period passes)
+            self._opened_at = time.monotonic()
+            self._half_open = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"[resilience] {self.name} circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._half_open = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._half_open or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._half_open = False
+                logger.error(f"[resilience] {self.name} circuit opened after {self._failures} consecutive failures")
+
+
+class ResilientCaller:
+    """
+    Key selection, rate limiting, retries and circuit breaking around one
+    provider endpoint.
+
+    Blocking calls run in a worker thread, and waits use asyncio.sleep, so a
+    caller's deadline cancels retries too.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, max_retries: int, api_keys: Optional[List[str]] = None):
+        self.name = name
+        self.pool = KeyPool(api_keys or GOOGLE_API_KEYS, requests_per_minute)
+        self.breaker = CircuitBreaker(name)
+        self.max_retries = max_retries
+        self._lock = Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def _handle_failure(self, key: PooledKey, error: Exception, attempt: int, retryable: bool = True) -> Optional[float]:
+        """
+        Record a failed call.
+
+        Returns:
+            Seconds to wait before retrying, or None if the error should be raised
+        """
+        kind = classify_error(error)
+        retry_after = retry_after_seconds(error)
+        with self._lock:
+            self.failures += 1
+            if kind == ERROR_RATE_LIMITED:
+                self.throttled += 1
+        if kind == ERROR_TRANSIENT:
+            self.breaker.record_failure()
+        else:
+            # The provider answered, so it isn't down
+            self.breaker.record_success()
+        if kind == ERROR_RATE_LIMITED:
+            # Only the throttled key is drained; the retry can go to another one
+            self.pool.on_throttle(key, retry_after)
+
+        if not retryable or kind == ERROR_FATAL or attempt >= self.max_retries:
+            return None
+        if kind == ERROR_RATE_LIMITED:
+            # The pool already holds callers back until a key has headroom
+            delay = 0.0
+        else:
+            delay = backoff_delay(attempt)
+        with self._lock:
+            self.retries += 1
+        logger.warning(
+            f"[resilience] {self.name} call with key {key.label} failed ({kind}), retry {attempt + 1}/{self.max_retries} "
+            f"in {delay:.1f}s: {str(error)[:200]}"
+        )
+        return delay
+
+    def _handle_success(self, key: PooledKey):
+        self.breaker.record_success()
+        self.pool.on_success(key)
+
+    async def _before_call(self, priority: str) -> PooledKey:
+        self.breaker.before_call()
+        key = await self.pool.acquire(priority)
+        with self._lock:
+            self.calls += 1
+        return key
+
+    async def call(self, func: Callable[..., Any], *args, priority: str = PRIORITY_INTERACTIVE, **kwargs) -> Any:
+        """
+        Call func(api_key, *args, **kwargs) (blocking or coroutine function)
+        with the key pool's rate limiting, retries with backoff and circuit
+        breaking. priority is the key pool's scheduling class for the call.
+
+        Raises:
+            CircuitOpenError: If the provider's circuit is open
+        """
+        attempt = 0
+        while True:
+            key = await self._before_call(priority)
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(key.api_key, *args, **kwargs)
+                else:
+                    result = await asyncio.to_thread(func, key.api_key, *args, **kwargs)
+            except Exception as e:
+                delay = self._handle_failure(key, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._handle_success(key)
+            return result
+
+    async def stream(self, start_stream: Callable[[str], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Stream from start_stream(api_key) with the same protection as call.
+        Failures are only retried before the first piece has been yielded.
+        """
+        attempt = 0
+        while True:
+            key = await self._before_call(PRIORITY_INTERACTIVE)
+            started = False
+            try:
+                async for piece in start_stream(key.api_key):
+                    started = True
+                    yield piece
+            except Exception as e:
+                delay = self._handle_failure(key, e, attempt, retryable=not started)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._handle_success(key)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+                "rate_per_minute": round(self.pool.rate, 1),
+                "circuit": self.breaker.state,
+                "keys": self.pool.stats(),
+                "priorities": self.pool.priority_stats()
+            }
+
+
+embedding_caller = ResilientCaller("embeddings", EMBEDDING_REQUESTS_PER_MINUTE, EMBEDDING_MAX_RETRIES)
+
+_chat_callers: Dict[str, ResilientCaller] = {}
+_chat_callers_lock = Lock()
+
+
+def get_chat_caller(model: str) -> ResilientCaller:
+    """The resilient caller for a chat model (each model has its own quota)."""
+    with _chat_callers_lock:
+        if model not in _chat_callers:
+            _chat_callers[model] = ResilientCaller(f"chat:{model}", CHAT_REQUESTS_PER_MINUTE, CHAT_MAX_RETRIES)
+        return _chat_callers[model]
+
+
+def resilience_stats() -> Dict[str, Dict[str, Any]]:
+    with _chat_callers_lock:
+        callers = [embedding_caller, *_chat_callers.values()]
+    return {caller.name: caller.stats() for caller in callers}
@@ -0,0 +1,283 @@
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import numpy as np
+
+# Standard RRF damping constant from Cormack et al.
+RRF_K = 60
+# MMR trade-off between relevance (1.0) and diversity (0.0)
+MMR_LAMBDA = 0.7
+# Share of the keyword example-text vector in a keyword-expanded query vector
+KEYWORD_EXPANSION_WEIGHT = 0.5
+
+
+def reciprocal_rank_scores(ranked_lists: List[List[str]], k: int = RRF_K) -> Dict[str, float]:
+    """
+    Compute reciprocal rank fusion scores for several ranked lists of chunk ids.
+
+    Args:
+        ranked_lists: Lists of chunk ids, each ordered best first
+        k: Damping constant, larger values flatten the contribution of top ranks
+
+    Returns:
+        Dict[str, float]: Fused score per chunk id, higher is better
+    """
+    scores: Dict[str, float] = {}
+    for ranked in ranked_lists:
+        for rank, chunk_id in enumerate(ranked, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+def mmr_select(embeddings: Sequence[Sequence[float]], relevance: Sequence[float], top_k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """
+    Pick a relevant but diverse subset of candidates with maximal marginal relevance.
+
+    Each step picks the candidate maximizing
+    lambda * relevance - (1 - lambda) * max cosine similarity to already picked candidates.
+
+    Args:
+        embeddings: Candidate embeddings, one row per candidate
+        relevance: Relevance score per candidate, higher is better, ideally in [0, 1]
+        top_k: Number of candidates to pick
+        lambda_mult: Relevance/diversity trade-off
+
+    Returns:
+        List[int]: Indices of the picked candidates in pick order
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    n = vectors.shape[0]
+    if n == 0 or top_k <= 0:
+        return []
+    top_k = min(top_k, n)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = vectors / norms
+    similarity = unit @ unit.T
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+
+    for _ in range(top_k):
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return selected
+
+
+def combine_embeddings(query_embedding: Sequence[float], keyword_embedding: Sequence[float], keyword_weight: float = KEYWORD_EXPANSION_WEIGHT) -> List[float]:
+    """
+    Expand a query vector with a keyword's example-text vector.
+
+    Both vectors are normalized before the weighted sum so neither dominates
+    by magnitude, which approximates embedding the concatenated texts.
+
+    Returns:
+        List[float]: Unit-length combined vector
+    """
+    vectors = np.asarray([query_embedding, keyword_embedding], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = vectors / norms
+    combined = (1 - keyword_weight) * unit[0] + keyword_weight * unit[1]
+    norm = np.linalg.norm(combined)
+    return (combined / norm if norm else combined).tolist()
+
+
+# Rough characters-per-token ratio for Gemini on English prose
+CHARS_PER_TOKEN = 4
+# Word shingle size and containment threshold used to spot near-duplicate chunks
+SHINGLE_SIZE = 5
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# Don't bother appending a truncated chunk with less room than this
+MIN_PARTIAL_CHUNK_TOKENS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in a piece of text."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def chunk_token_count(chunk: Dict[str, Any]) -> int:
+    """Token count for a chunk, using the count precomputed at ingestion when available."""
+    metadata = chunk.get("metadata") or {}
+    token_count = metadata.get("token_count")
+    if isinstance(token_count, int):
+        return token_count
+    return estimate_tokens(chunk["text"])
+
+
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _is_near_duplicate(shingles: Set[Tuple[str, ...]], kept: List[Set[Tuple[str, ...]]]) -> bool:
+    for other in kept:
+        if not shingles or not other:
+            continue
+        overlap = len(shingles & other)
+        # Containment covers a chunk that is mostly a subset of a longer one
+        if overlap / min(len(shingles), len(other)) >= NEAR_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+def filter_by_distance(ids: List[str], distances: List[float], ratio: float, max_distance: Optional[float] = None) -> List[str]:
+    """
+    Keep vector hits whose distance is close to the best hit.
+
+    Args:
+        ids: Chunk ids ordered best first
+        distances: Matching distances, lower is better
+        ratio: Keep hits with distance <= best distance * ratio
+        max_distance: Optional absolute cutoff
+
+    Returns:
+        List[str]: Ids that pass the cutoff; the best hit is always kept
+    """
+    if not ids:
+        return []
+    cutoff = distances[0] * ratio
+    if max_distance is not None:
+        cutoff = min(cutoff, max_distance)
+    return [ids[0]] + [chunk_id for chunk_id, distance in zip(ids[1:], distances[1:]) if distance <= cutoff]
+
+
+def pack_context(chunks: List[Dict[str, Any]], token_budget: int) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Select chunks for the prompt within a token budget.
+
+    Chunks are taken in order (best first), near-duplicates of an already
+    selected chunk are dropped, and the last chunk that doesn't fit is
+    truncated if enough budget remains.
+
+    Args:
+        chunks: Dicts with "id", "text" and "metadata", best first
+        token_budget: Maximum context tokens
+
+    Returns:
+        Tuple of the packed chunks and stats with candidate_tokens,
+        packed_tokens, duplicates and dropped counts
+    """
+    packed = []
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    candidate_tokens = 0
+    packed_tokens = 0
+    duplicates = 0
+    dropped = 0
+
+    for chunk in chunks:
+        tokens = chunk_token_count(chunk)
+        candidate_tokens += tokens
+
+        shingles = _shingles(chunk["text"])
+        if _is_near_duplicate(shingles, kept_shingles):
+            duplicates += 1
+            continue
+
+        remaining = token_budget - packed_tokens
+        if tokens <= remaining:
+            packed.append(chunk)
+            kept_shingles.append(shingles)
+            packed_tokens += tokens
+        elif remaining >= MIN_PARTIAL_CHUNK_TOKENS:
+            truncated = chunk["text"][:remaining * CHARS_PER_TOKEN]
+            packed.append({**chunk, "text": truncated, "truncated": True})
+            kept_shingles.append(shingles)
+            packed_tokens += estimate_tokens(truncated)
+        else:
+            dropped += 1
+
+    return packed, {
+        "candidate_tokens": candidate_tokens,
+        "packed_tokens": packed_tokens,
+        "duplicates": duplicates,
+        "dropped": dropped
+    }
+
+
+def build_where_filter(scope: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Translate a retrieval scope into a Chroma where filter.
+
+    Args:
+        scope: Optional dict with "document_ids" (list of ids), "page_ranges"
+            (list of (start, end) tuples, inclusive), "sections" (list of
+            CSI section numbers) and "divisions" (list of two digit
+            MasterFormat divisions)
+
+    Returns:
+        Chroma where clause, or None when the scope is empty
+    """
+    if not scope:
+        return None
+
+    conditions = []
+    document_ids = scope.get("document_ids")
+    if document_ids:
+        conditions.append({"document_id": {"$in": list(document_ids)}})
+
+    page_ranges = scope.get("page_ranges")
+    if page_ranges:
+        # A chunk is in range if its page span overlaps the requested range
+        range_conditions = [
+            {"$and": [{"page_start": {"$lte": end}}, {"page_end": {"$gte": start}}]}
+            for start, end in page_ranges
+        ]
+        conditions.append(range_conditions[0] if len(range_conditions) == 1 else {"$or": range_conditions})
+
+    sections = scope.get("sections")
+    if sections:
+        conditions.append({"section_number": {"$in": list(sections)}})
+
+    divisions = scope.get("divisions")
+    if divisions:
+        conditions.append({"division": {"$in": list(divisions)}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def metadata_in_scope(metadata: Dict[str, Any], scope: Optional[Dict[str, Any]]) -> bool:
+    """Check a chunk's metadata against a retrieval scope (same rules as build_where_filter)."""
+    if not scope:
+        return True
+
+    document_ids = scope.get("document_ids")
+    if document_ids and metadata.get("document_id") not in document_ids:
+        return False
+
+    page_ranges = scope.get("page_ranges")
+    if page_ranges:
+        page_start = metadata.get("page_start")
+        page_end = metadata.get("page_end")
+        if page_start is None or page_end is None:
+            return False
+        if not any(page_start <= end and page_end >= start for start, end in page_ranges):
+            return False
+
+    sections = scope.get("sections")
+    if sections and metadata.get("section_number") not in sections:
+        return False
+
+    divisions = scope.get("divisions")
+    if divisions and metadata.get("division") not in divisions:
+        return False
+
+    return True
@@ -0,0 +1,144 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# CSI MasterFormat section header at the start of a line, e.g.
+# "SECTION 26 51 00 - INTERIOR LIGHTING" or "SECTION 265100 – INTERIOR LIGHTING"
+SECTION_HEADER_PATTERN = re.compile(
+    r"^[ \t]*SECTION[ \t]+(\d{2})[ \t]?(\d{2})[ \t]?(\d{2})(?:\.(\d{2}))?[ \t]*[-–—:]?[ \t]*(.*)$",
+    re.MULTILINE
+)
+# Section numbers referenced in free text: "08 71 00", "26 51 00.13", or the
+# compact "Section 087100" form (compact numbers need the word "section" in
+# front, since a bare six digit number could be anything)
+SECTION_REFERENCE_PATTERN = re.compile(
+    r"\b(\d{2}) (\d{2}) (\d{2})(?:\.(\d{2}))?\b"
+    r"|\bsection\s+(\d{2})(\d{2})(\d{2})(?:\.(\d{2}))?\b",
+    re.IGNORECASE
+)
+# Characters of section text (after the header) embedded as the section summary
+SECTION_SUMMARY_CHARS = 2000
+MAX_TITLE_CHARS = 120
+
+
+def format_section_number(division: str, group: str, detail: str, suffix: Optional[str] = None) -> str:
+    """Canonical "26 51 00" / "26 51 00.13" form of a section number."""
+    number = f"{division} {group} {detail}"
+    return f"{number}.{suffix}" if suffix else number
+
+
+def division_for_section(number: str) -> str:
+    """MasterFormat division ("26") of a section number ("26 51 00")."""
+    return number[:2]
+
+
+def detect_sections(text: str) -> List[Dict[str, Any]]:
+    """
+    Find CSI MasterFormat sections in a document's text.
+
+    Spec books often repeat the section header on every page, so consecutive
+    headers with the same number are treated as one section.
+
+    Returns:
+        List of dicts with number, title, start and end character offsets, in
+        document order. Text before the first header belongs to no section.
+    """
+    sections: List[Dict[str, Any]] = []
+    for match in SECTION_HEADER_PATTERN.finditer(text):
+        number = format_section_number(*match.group(1, 2, 3, 4))
+        if sections and sections[-1]["number"] == number:
+            continue
+        if sections:
+            sections[-1]["end"] = match.start()
+        sections.append({
+            "number": number,
+            "title": match.group(5).strip()[:MAX_TITLE_CHARS],
+            "start": match.start(),
+            "end": len(text)
+        })
+    return sections
+
+
+def extract_section_references(message: str) -> List[str]:
+    """
+    Find CSI section numbers named explicitly in a question.
+
+    Returns:
+        List[str]: Canonical section numbers in order of appearance
+    """
+    references = []
+    for match in SECTION_REFERENCE_PATTERN.finditer(message):
+        groups = match.group(1, 2, 3, 4) if match.group(1) else match.group(5, 6, 7, 8)
+        number = format_section_number(*groups)
+        if number not in references:
+            references.append(number)
+    return references
+
+
+def sections_for_span(sections: List[Dict[str, Any]], start: int, end: int) -> List[Dict[str, Any]]:
+    """Return every section overlapping the [start, end) span."""
+    return [section for section in sections if start < section["end"] and end > section["start"]]
+
+
+def section_for_span(sections: List[Dict[str, Any]], start: int, end: int) -> Optional[Dict[str, Any]]:
+    """Return the section covering most of the [start, end) span, if any."""
+    best = None
+    best_overlap = 0
+    for section in sections:
+        overlap = min(end, section["end"]) - max(start, section["start"])
+        if overlap > best_overlap:
+            best, best_overlap = section, overlap
+    return best
+
+
+def page_offsets(page_texts: List[Tuple[int, str]]) -> List[Tuple[int, int, int]]:
+    """
+    Character offsets of each page within the concatenated document text
+    (pages joined with a newline).
+
+    Returns:
+        List of (page number, start, end) tuples
+    """
+    offsets = []
+    current_pos = 0
+    for page_num, page_text in page_texts:
+        offsets.append((page_num, current_pos, current_pos + len(page_text)))
+        current_pos += len(page_text) + 1  # +1 for the newline between pages
+    return offsets
+
+
+def pages_for_span(offsets: List[Tuple[int, int, int]], start: int, end: int) -> List[int]:
+    """Page numbers overlapping the [start, end) character span."""
+    return [page_num for page_num, page_start, page_end in offsets if start < page_end and end > page_start]
+
+
+def build_section_summary(text: str, section: Dict[str, Any]) -> str:
+    """
+    Text embedded for section routing: the header plus the opening of the
+    section, which in MasterFormat covers the summary/scope articles.
+    """
+    body = text[section["start"]:section["end"]]
+    return body[:SECTION_SUMMARY_CHARS].strip()
+
+
+def route_query(section_collection, query_embedding: List[float], top_k: int, where: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Find the sections whose summaries best match the query.
+
+    Returns:
+        List[str]: Section numbers, best match first
+    """
+    results = section_collection.query(
+        query_embeddings=[query_embedding],
+        n_results=top_k,
+        where=where,
+        include=["metadatas"]
+    )
+    section_numbers = []
+    for metadata in results["metadatas"][0]:
+        number = metadata.get("section_number")
+        if number and number not in section_numbers:
+            section_numbers.append(number)
+    return section_numbers
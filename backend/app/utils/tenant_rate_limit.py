@@ -0,0 +1,162 @@
+import logging
+import math
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Dict, Optional, Set
+
+from app.database.database import DB_DIR
+
+logger = logging.getLogger(__name__)
+
+# Inbound rate limiting per tenant (user id). Each tenant has a token bucket
+# holding up to a minute's worth of its tier's requests, refilled continuously
+TENANT_RATE_LIMIT_ENABLED = os.getenv("TENANT_RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Optionally keep bucket levels in SQLite so a restart doesn't hand every
+# tenant a full bucket; buckets are written behind, at most this often
+TENANT_RATE_LIMIT_PERSIST = os.getenv("TENANT_RATE_LIMIT_PERSIST", "false").lower() == "true"
+TENANT_RATE_LIMIT_DB_PATH = os.getenv("TENANT_RATE_LIMIT_DB_PATH", os.path.join(DB_DIR, "rate_limits.db"))
+TENANT_RATE_LIMIT_FLUSH_SECONDS = 5
+
+
+class RateLimitResult:
+    """Outcome of a rate limit check, with the values for the X-RateLimit-* headers."""
+
+    __slots__ = ("allowed", "limit", "remaining", "reset_seconds", "retry_after")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset_seconds: int, retry_after: Optional[int] = None):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_seconds = reset_seconds
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset_seconds)
+        }
+        if self.retry_after is not None:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+class TenantRateLimiter:
+    """
+    Token bucket per tenant, checked in memory in O(1).
+
+    A bucket holds up to requests_per_minute tokens and refills at that rate;
+    a request spends cost tokens or is refused. Bucket levels are stored
+    with wall-clock times so persisted buckets keep refilling while the
+    server is down.
+    """
+
+    def __init__(self, persist: bool = TENANT_RATE_LIMIT_PERSIST, db_path: str = TENANT_RATE_LIMIT_DB_PATH):
+        self.persist = persist
+        self.db_path = db_path
+        # Tenant -> [tokens, updated_at]
+        self._buckets: Dict[int, list] = {}
+        self._dirty: Set[int] = set()
+        self._lock = Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._flushed_at = time.time()
+        self.allowed = 0
+        self.limited = 0
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tenant_buckets ("
+                "tenant_id INTEGER PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            logger.info(f"[rate_limit] Persisting tenant buckets to {self.db_path}")
+        return self._connection
+
+    def _load(self, tenant_id: int, capacity: float, now: float) -> list:
+        """The tenant's bucket, read from SQLite the first time it's seen (a full one if none was saved)."""
+        if self.persist:
+            try:
+                row = self._get_connection().execute(
+                    "SELECT tokens, updated_at FROM tenant_buckets WHERE tenant_id = ?", (tenant_id,)
+                ).fetchone()
+                if row is not None:
+                    return [min(capacity, row[0]), min(now, row[1])]
+            except sqlite3.Error as e:
+                logger.error(f"[rate_limit] Could not load the bucket of tenant {tenant_id}: {str(e)}")
+        return [capacity, now]
+
+    def _flush(self, now: float):
+        if not self._dirty:
+            return
+        rows = [(tenant_id, *self._buckets[tenant_id]) for tenant_id in self._dirty]
+        try:
+            connection = self._get_connection()
+            connection.executemany(
+                "INSERT OR REPLACE INTO tenant_buckets (tenant_id, tokens, updated_at) VALUES (?, ?, ?)", rows
+            )
+            connection.commit()
+            self._dirty.clear()
+        except sqlite3.Error as e:
+            logger.error(f"[rate_limit] Could not persist {len(rows)} tenant buckets: {str(e)}")
+        self._flushed_at = now
+
+    def flush(self):
+        """Write pending bucket levels to SQLite (e.g. on shutdown)."""
+        if self.persist:
+            with self._lock:
+                self._flush(time.time())
+
+    def check(self, tenant_id: int, requests_per_minute: float, cost: float = 1.0) -> RateLimitResult:
+        """
+        Spend cost tokens from the tenant's bucket if it has them.
+
+        Args:
+            requests_per_minute: The tenant's limit; also the bucket's capacity
+            cost: Tokens the request needs (capped at the capacity, so a large
+                request only has to wait for a full bucket)
+        """
+        capacity = float(requests_per_minute)
+        rate = capacity / 60
+        cost = min(cost, capacity)
+        with self._lock:
+            now = time.time()
+            bucket = self._buckets.get(tenant_id)
+            if bucket is None:
+                bucket = self._buckets[tenant_id] = self._load(tenant_id, capacity, now)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            allowed = bucket[0] >= cost
+            if allowed:
+                bucket[0] -= cost
+                self.allowed += 1
+            else:
+                self.limited += 1
+            if self.persist:
+                self._dirty.add(tenant_id)
+                if now - self._flushed_at >= TENANT_RATE_LIMIT_FLUSH_SECONDS:
+                    self._flush(now)
+            tokens = bucket[0]
+
+        return RateLimitResult(
+            allowed=allowed,
+            limit=int(capacity),
+            remaining=int(tokens),
+            reset_seconds=math.ceil((capacity - tokens) / rate),
+            retry_after=None if allowed else max(1, math.ceil((cost - tokens) / rate))
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tenants": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+                "persisted": self.persist
+            }
+
+
+tenant_rate_limiter = TenantRateLimiter()
@@ -5,6 +5,7 @@ from app.database.database import engine, get_db
 from app.models import user as models
 from app.models.document import Document
 from app.models.keyword import Keyword
+from app.models.keyword_embedding import KeywordEmbedding
 from app.schemas import user as schemas
 from app.schemas.user import UserUpdate, UserProfile, SubscriptionTier, SubscriptionStatus
 from app.schemas.document import DocumentCreate, Document as DocumentSchema
@@ -18,20 +19,43 @@ from app.utils.firebase_auth import initialize_firebase, get_current_user_from_t
 from pydantic import BaseModel
 import PyPDF2
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 import chromadb
 import os
 from dotenv import load_dotenv
 from enum import Enum
 import json
+import math
 import logging
+import asyncio
 from datetime import datetime, timedelta
 from time import sleep
 from fastapi.responses import StreamingResponse
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, List, Optional, Tuple
 from contextlib import asynccontextmanager
 import stripe
-from app.utils.helpers import get_collection_name, find_applicable_keywords
+from app.utils.helpers import get_collection_name, get_section_collection_name
+from app.utils.section_index import route_query, extract_section_references
+from app.utils.keyword_matcher import get_keyword_matcher, get_keyword_phrase_matcher
+from app.utils.keyword_index import index_keywords, delete_keywords
+from app.utils.keyword_embeddings import store_keyword_embeddings, get_keyword_embeddings, delete_keyword_embedding
+from app.utils.answer_cache import answer_cache
+from app.utils.corpus_version import get_corpus_version, bump_document_version, bump_keyword_version
+from app.utils.retrieval import (
+    reciprocal_rank_scores, filter_by_distance, mmr_select, combine_embeddings, pack_context, estimate_tokens,
+    build_where_filter, metadata_in_scope
+)
+from app.utils import lexical_index
+from app.utils.pipeline import StageTimer, StageTimeout
+from app.utils.single_flight import SingleFlight
+from app.utils.model_router import ROUTES, ROUTE_CHIT_CHAT, classify_message, classify_question, route_metrics
+from app.utils.hedging import HEDGING_ENABLED, get_hedge_policy, hedged_stream, hedging_stats
+from app.utils.resilience import CircuitOpenError, embedding_caller, get_chat_caller, resilience_stats
+from app.utils.key_pool import PRIORITY_INGESTION, PRIORITY_INTERACTIVE
+from app.llm.config import get_embeddings
+from app.utils.embedding_batcher import query_embedding_batcher
+from app.utils.generation_scheduler import GenerationScheduler, GenerationShed
+from app.utils.admission import AdmissionControlMiddleware, admission_stats
+from app.utils.tenant_rate_limit import TENANT_RATE_LIMIT_ENABLED, tenant_rate_limiter
 import re
 
 # Configure logging
@@ -56,6 +80,9 @@ SUBSCRIPTION_TIERS = {
         "name": "Shipwright Free",
         "price": 0.0,
         "price_id": os.getenv("STRIPE_PRICE_FREE", "price_1StxupFzOLfPxRPBtGSqu9ac"),
+        "ask_deadline_seconds": 30,
+        "ask_requests_per_minute": 10,
+        "generation_weight": 1,
         "features": [
             "5 document uploads per month",
             "Basic AI chat assistance",
@@ -67,6 +94,9 @@ SUBSCRIPTION_TIERS = {
         "name": "Shipwright Pro",
         "price": 20.0,
         "price_id": os.getenv("STRIPE_PRICE_PRO", "price_1StxvIFzOLfPxRPBa3WMHl4g"),
+        "ask_deadline_seconds": 45,
+        "ask_requests_per_minute": 60,
+        "generation_weight": 3,
         "features": [
             "Unlimited document uploads",
             "Advanced AI chat assistance",
@@ -80,6 +110,9 @@ SUBSCRIPTION_TIERS = {
         "name": "Shipwright Enterprise",
         "price": 99.0,
         "price_id": os.getenv("STRIPE_PRICE_ENTERPRISE", "price_1StxvkFzOLfPxRPBnHHoPxyL"),
+        "ask_deadline_seconds": 60,
+        "ask_requests_per_minute": 300,
+        "generation_weight": 6,
         "features": [
             "Everything in Pro",
             "Unlimited team members",
@@ -92,9 +125,13 @@ SUBSCRIPTION_TIERS = {
     }
 }
 
+# LLM generations share a global concurrency cap, weighted by subscription tier
+generation_scheduler = GenerationScheduler({tier: data["generation_weight"] for tier, data in SUBSCRIPTION_TIERS.items()})
+
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 Document.__table__.create(bind=engine, checkfirst=True)
+KeywordEmbedding.__table__.create(bind=engine, checkfirst=True)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -107,7 +144,7 @@ async def lifespan(app: FastAPI):
         logger.error(f"Error during startup: {str(e)}")
     yield
     # Shutdown
-    pass
+    tenant_rate_limiter.flush()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -123,6 +160,18 @@ async def request_logging_middleware(request: Request, call_next):
     logger.info(f"[request] end request_id={request_id} status={response.status_code} path={request.url.path}")
     return response
 
+@app.middleware("http")
+async def rate_limit_headers_middleware(request: Request, call_next):
+    # Rate-limited endpoints leave their tenant's bucket state for the X-RateLimit-* headers
+    response = await call_next(request)
+    rate_limit = getattr(request.state, "rate_limit", None)
+    if rate_limit is not None:
+        response.headers.update(rate_limit.headers())
+    return response
+
+# Admission control wraps the app outside the HTTP middlewares above
+app.add_middleware(AdmissionControlMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -132,6 +181,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Coalesces identical concurrent /ask requests
+ask_single_flight = SingleFlight()
+
 # Initialize ChromaDB client with new configuration
 chroma_client = chromadb.PersistentClient(path="./data/chroma")
 
@@ -143,12 +195,63 @@ text_splitter = RecursiveCharacterTextSplitter(
     separators=["\n\n", "\n", " ", ""]
 )
 
-# Initialize embeddings with Google's model
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    google_api_key=os.getenv("GOOGLE_API_KEY")
+# Hybrid retrieval configuration
+LEXICAL_TOP_K = 5  # BM25 candidates fused with the vector results
+HYBRID_MAX_CHUNKS = 20  # Fused candidate pool handed to MMR
+SCOPED_LEXICAL_OVERFETCH = 4  # Extra BM25 hits fetched when a retrieval scope filters them afterwards
+MMR_TOP_K = 6  # Diverse chunks selected from the fused pool
+NEIGHBOR_EXPANSION_TOP_K = 2  # Top hits whose previous/next chunks are added when expand_neighbors is set
+
+# Hierarchical retrieval: route questions to the best matching CSI sections first
+SECTION_ROUTING_TOP_K = 3
+SECTION_ROUTING_MIN_SECTIONS = 5  # Below this, routing can't narrow the search meaningfully
+SECTION_LOOKUP_MAX_CHUNKS = 20  # Chunks fetched when a question names its sections explicitly
+
+# Trade-aware retrieval: MasterFormat divisions searched per chat mode (None searches all)
+TRADE_DIVISIONS = {
+    "NONE": None,
+    "GC": None,
+    "MC": ["22", "23"],
+    "EC": ["26", "27", "28"]
+}
+TRADE_FILTER_MIN_RESULTS = 3  # Fewer trade-filtered vector hits than this falls back to all divisions
+
+# Context packing configuration
+SEMANTIC_CANDIDATES = 20  # Vector hits fetched once, before the distance cutoff and MMR
+DISTANCE_CUTOFF_RATIO = 1.3  # Keep vector hits within this factor of the best distance
+CONTEXT_TOKEN_BUDGETS = {  # Context tokens per chat mode
+    "NONE": 4000,
+    "GC": 6000,
+    "MC": 5000,
+    "EC": 5000
+}
+
+# Per-stage timeouts in seconds for the /ask pipeline. Optional stages (lexical,
+# keyword lookups) are skipped on timeout; the others fail the request with a 504.
+STAGE_TIMEOUTS = {
+    "keywords": 10,
+    "section_lookup": 10,
+    "embed_query": 20,
+    "keyword_embeddings": 20,
+    "lexical_search": 10,
+    "vector_search": 20,
+    "keyword_search": 20,
+    "fuse": 20,
+    "llm": 120
+}
+# Every /ask stage is also bounded by the request deadline: the user's tier
+# "ask_deadline_seconds", or a shorter one sent in the X-Deadline-Ms header.
+# When the LLM runs out of time the retrieved chunks are returned with whatever
+# part of the answer was generated.
+SOURCES_ONLY_RESPONSE = (
+    "I couldn't finish writing an answer in time. "
+    "The most relevant passages from your documents are included below."
 )
 
+# Batch question answering configuration
+BATCH_MAX_QUESTIONS = 50
+BATCH_LLM_CONCURRENCY = 4  # Questions answered (retrieval and generation) concurrently per batch request
+
 class ChatMode(str, Enum):
     NONE = "NONE"
     GC = "GC"
@@ -162,27 +265,135 @@ def get_prompt_framing(mode: ChatMode) -> str:
     if mode == ChatMode.NONE:
         return base_framing
     elif mode == ChatMode.GC:
-        return """You are Shipwright, an AI assistant specialized in construction document analysis for General Contractors (GCs). 
-        Focus on overall project scope, scheduling, coordination between trades, and general construction requirements. 
-        Answer the question based only on the provided context, emphasizing aspects relevant to GC responsibilities."""
+        return (
+            "You are Shipwright, an AI assistant specialized in construction document analysis for General Contractors (GCs). "
+            "Focus on overall project scope, scheduling, coordination between trades, and general construction requirements. "
+            "Answer the question based only on the provided context, emphasizing aspects relevant to GC responsibilities."
+        )
     elif mode == ChatMode.MC:
-        return """You are Shipwright, an AI assistant specialized in construction document analysis for Mechanical Contractors (MCs). 
-        Focus on HVAC systems, mechanical equipment, ductwork, piping, and mechanical specifications. 
-        Answer the question based only on the provided context, emphasizing mechanical systems and related requirements."""
+        return (
+            "You are Shipwright, an AI assistant specialized in construction document analysis for Mechanical Contractors (MCs). "
+            "Focus on HVAC systems, mechanical equipment, ductwork, piping, and mechanical specifications. "
+            "Answer the question based only on the provided context, emphasizing mechanical systems and related requirements."
+        )
     elif mode == ChatMode.EC:
-        return """You are Shipwright, an AI assistant specialized in construction document analysis for Electrical Contractors (ECs). 
-        Focus on electrical systems, power distribution, lighting, controls, and electrical specifications. 
-        Answer the question based only on the provided context, emphasizing electrical systems and related requirements."""
+        return (
+            "You are Shipwright, an AI assistant specialized in construction document analysis for Electrical Contractors (ECs). "
+            "Focus on electrical systems, power distribution, lighting, controls, and electrical specifications. "
+            "Answer the question based only on the provided context, emphasizing electrical systems and related requirements."
+        )
     return base_framing
 
 
+def build_prompt(mode: ChatMode, context: str, message: str, applicable_keywords: list) -> str:
+    """
+    Build the /ask prompt. Kept free of indentation whitespace since every
+    character is sent to (and billed by) the LLM.
+    """
+    prompt = (
+        f"{get_prompt_framing(mode)}\n\n"
+        f"<context>\n{context}\n</context>\n\n"
+        f"<question>\n{message}\n</question>\n"
+    )
+    
+    # Add keyword section if applicable keywords were found
+    if applicable_keywords:
+        prompt += "\nAdditional instructions for specific keywords:\n"
+        for keyword in applicable_keywords:
+            prompt += f"- {keyword.term}: {keyword.example_text}\n"
+    
+    return prompt
+
+
+def build_chit_chat_prompt(message: str) -> str:
+    """Prompt for small talk, which is answered without document context."""
+    return (
+        "You are a friendly assistant named Shipwright that answers questions about construction documents. "
+        "Reply briefly to the user's message and offer to help with their documents.\n\n"
+        f"<message>\n{message}\n</message>\n"
+    )
+
+
+class PageRange(BaseModel):
+    start: int
+    end: int
+
 class ChatRequest(BaseModel):
     message: str
     mode: ChatMode = ChatMode.NONE
+    # Optional retrieval scope: only search these documents, pages or CSI sections
+    document_ids: Optional[List[str]] = None
+    page_ranges: Optional[List[PageRange]] = None
+    sections: Optional[List[str]] = None
+    # Add the chunks just before and after the top hits (e.g. a table continuing onto the next chunk)
+    expand_neighbors: bool = False
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    mode: ChatMode = ChatMode.NONE
+    document_ids: Optional[List[str]] = None
+    page_ranges: Optional[List[PageRange]] = None
+    sections: Optional[List[str]] = None
+    expand_neighbors: bool = False
+
+def get_retrieval_scope(request) -> Optional[dict]:
+    """Collect the optional document, page range and section filters from a chat request."""
+    scope = {}
+    if request.document_ids:
+        scope["document_ids"] = request.document_ids
+    if request.page_ranges:
+        scope["page_ranges"] = [(page_range.start, page_range.end) for page_range in request.page_ranges]
+    if request.sections:
+        scope["sections"] = request.sections
+    return scope or None
+
+def get_cache_scope(scope: Optional[dict], expand_neighbors: bool = False) -> str:
+    """Answer cache key component for the request options that shape retrieval."""
+    options = {**(scope or {}), "expand_neighbors": True} if expand_neighbors else scope
+    return json.dumps(options, sort_keys=True) if options else ""
 
 class PDFUploadRequest(BaseModel):
     user_id: int
 
+def get_trade_scope(mode: ChatMode, scope: Optional[dict]) -> Optional[dict]:
+    """
+    Narrow a retrieval scope to the chat mode's MasterFormat divisions.
+    Requests that name their own sections are left as they are.
+    """
+    divisions = TRADE_DIVISIONS.get(mode.value)
+    if not divisions or (scope and scope.get("sections")):
+        return scope
+    return {**(scope or {}), "divisions": divisions}
+
+def get_ask_deadline(user: models.User, deadline_ms: Optional[int] = None) -> float:
+    """Seconds an /ask request may take: the tier's deadline, shortened by the client's if given."""
+    tier = SUBSCRIPTION_TIERS.get(user.subscription_tier or "free", SUBSCRIPTION_TIERS["free"])
+    deadline = tier["ask_deadline_seconds"]
+    if deadline_ms is not None and deadline_ms > 0:
+        deadline = min(deadline, deadline_ms / 1000)
+    return deadline
+
+def check_rate_limit(http_request: Request, user: models.User, cost: float = 1.0):
+    """
+    Spend cost requests from the user's per-minute /ask allowance (set by their
+    subscription tier).
+
+    Raises:
+        HTTPException: 429 with Retry-After once the allowance is used up
+    """
+    if not TENANT_RATE_LIMIT_ENABLED:
+        return
+    tier = SUBSCRIPTION_TIERS.get(user.subscription_tier or "free", SUBSCRIPTION_TIERS["free"])
+    result = tenant_rate_limiter.check(user.id, tier["ask_requests_per_minute"], cost)
+    http_request.state.rate_limit = result
+    if not result.allowed:
+        logger.warning(f"[rate_limit] user_id: {user.id} is over {result.limit} requests/minute")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit of {result.limit} requests per minute exceeded, retry in {result.retry_after}s",
+            headers=result.headers()
+        )
+
 def get_current_user(authorization: str = Header(None, alias="Authorization"), db: Session = Depends(get_db)) -> models.User:
     """
     FastAPI dependency to get current user from Firebase token.
@@ -212,6 +423,11 @@ def get_current_user(authorization: str = Header(None, alias="Authorization"), d
         logger.error(f"[get_current_user] Unexpected error: {str(e)}")
         raise HTTPException(status_code=401, detail="Authentication failed")
 
+def get_rate_limited_user(http_request: Request, current_user: models.User = Depends(get_current_user)) -> models.User:
+    """FastAPI dependency: the current user, after spending one request of their rate limit."""
+    check_rate_limit(http_request, current_user)
+    return current_user
+
 @app.get("/ping")
 async def ping():
     return {"message": "pong"}
@@ -290,131 +506,899 @@ def read_user(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
+def get_query_results(results: dict, index: int) -> dict:
+    """Slice the results for one query out of a (possibly multi-query) Chroma query result."""
+    return {
+        key: results[key][index]
+        for key in ("ids", "documents", "metadatas", "distances", "embeddings")
+        if results.get(key) is not None
+    }
+
+def route_to_sections(user_id: int, query_embedding: list, scope: Optional[dict] = None) -> Optional[List[str]]:
+    """
+    First stage of hierarchical retrieval: pick the CSI sections whose summaries
+    best match the question, so the chunk search only covers those sections.
+    
+    Returns:
+        List of section numbers, or None when routing doesn't apply (no section
+        index, too few sections, or the request already names sections)
+    """
+    if scope and scope.get("sections"):
+        return None
+    try:
+        section_collection = chroma_client.get_collection(get_section_collection_name(user_id))
+    except Exception:
+        return None
+    if section_collection.count() < SECTION_ROUTING_MIN_SECTIONS:
+        return None
+    
+    where = build_where_filter({
+        key: scope[key] for key in ("document_ids", "divisions") if scope and scope.get(key)
+    })
+    sections = route_query(section_collection, query_embedding, SECTION_ROUTING_TOP_K, where)
+    logger.info(f"[ask] Routed question to sections: {sections}")
+    return sections or None
+
+def query_chunks(collection, query_embedding: list, scope: Optional[dict], routed_sections: Optional[List[str]]) -> dict:
+    """
+    Second stage of hierarchical retrieval: vector search over the routed
+    sections' chunks, falling back to the whole (scoped) collection when the
+    routed sections have no matching chunks.
+    """
+    include = ["documents", "metadatas", "distances", "embeddings"]
+    if routed_sections:
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=SEMANTIC_CANDIDATES,
+            where=build_where_filter({**(scope or {}), "sections": routed_sections}),
+            include=include
+        )
+        if results['ids'][0]:
+            return results
+    return collection.query(
+        query_embeddings=[query_embedding],
+        n_results=SEMANTIC_CANDIDATES,
+        where=build_where_filter(scope),
+        include=include
+    )
+
+def search_chunks(user_id: int, collection, query_embedding: list, mode: ChatMode, scope: Optional[dict]):
+    """
+    Vector search restricted to the chat mode's trade divisions, widened to all
+    divisions when the trade filter leaves too few hits.
+    
+    Returns:
+        Tuple of the single-query Chroma results and the scope they were found with
+    """
+    trade_scope = get_trade_scope(mode, scope)
+    routed_sections = route_to_sections(user_id, query_embedding, trade_scope)
+    results = get_query_results(query_chunks(collection, query_embedding, trade_scope, routed_sections), 0)
+    if trade_scope is not scope and len(results['ids']) < TRADE_FILTER_MIN_RESULTS:
+        logger.info(f"[ask] {mode.value} trade filter matched {len(results['ids'])} chunks, searching all divisions")
+        routed_sections = route_to_sections(user_id, query_embedding, scope)
+        results = get_query_results(query_chunks(collection, query_embedding, scope, routed_sections), 0)
+        trade_scope = scope
+    return results, trade_scope
+
+def lexical_candidates(user_id: int, message: str, applicable_keywords: list, collection, scope: Optional[dict] = None) -> dict:
+    """
+    The local, embedding-free part of retrieval: BM25 over the question, plus
+    the chunks each keyword points at (inverted index, then phrase search).
+    
+    Returns:
+        Dict with "candidates" (chunk dicts by id), "ranked_lists" (one ranked id
+        list per retriever) and "unresolved_keywords" (keywords still needing a
+        vector search)
+    """
+    candidates = {}
+    ranked_lists = []
+    unresolved_keywords = []
+    
+    # Scoped searches over-fetch lexical hits since out-of-scope ones are filtered afterwards
+    lexical_limit_factor = SCOPED_LEXICAL_OVERFETCH if scope else 1
+    
+    # Lexical BM25 search catches exact identifiers (section numbers, model numbers, UL/NFPA references)
+    lexical_hits = [
+        hit for hit in lexical_index.search(user_id, message, limit=LEXICAL_TOP_K * lexical_limit_factor)
+        if metadata_in_scope(hit["metadata"], scope)
+    ][:LEXICAL_TOP_K]
+    for hit in lexical_hits:
+        candidates.setdefault(hit["id"], {"text": hit["text"], "metadata": hit["metadata"]})
+    ranked_lists.append([hit["id"] for hit in lexical_hits])
+    
+    # If we have applicable keywords, enhance the results
+    for keyword in applicable_keywords:
+        # Chunks containing the keyword's target phrases are known from ingestion; fetch them by id
+        indexed_ids = lexical_index.get_keyword_chunk_ids(user_id, keyword.id)
+        if indexed_ids:
+            keyword_hits = get_chunks_by_id(
+                collection,
+                rank_chunk_ids(user_id, message, indexed_ids)[:3 * lexical_limit_factor],
+                scope,
+                include_embeddings=True
+            )[:3]
+            if keyword_hits:
+                for hit in keyword_hits:
+                    candidates.setdefault(hit["id"], {"text": hit["text"], "metadata": hit["metadata"], "embedding": hit["embedding"]})
+                ranked_lists.append([hit["id"] for hit in keyword_hits])
+                continue
+        
+        # Otherwise match the target phrases with a local full-text search, which costs no API call either
+        keyword_hits = [
+            hit for hit in lexical_index.search_phrases(user_id, keyword.example_text.split(","), limit=3 * lexical_limit_factor)
+            if metadata_in_scope(hit["metadata"], scope)
+        ][:3]
+        if keyword_hits:
+            for hit in keyword_hits:
+                candidates.setdefault(hit["id"], {"text": hit["text"], "metadata": hit["metadata"]})
+            ranked_lists.append([hit["id"] for hit in keyword_hits])
+            continue
+        
+        unresolved_keywords.append(keyword)
+    
+    return {"candidates": candidates, "ranked_lists": ranked_lists, "unresolved_keywords": unresolved_keywords}
+
+async def keyword_vector_candidates(
+    message: str,
+    keyword,
+    collection,
+    scope: Optional[dict] = None,
+    query_embedding: Optional[list] = None,
+    keyword_embedding: Optional[list] = None
+) -> dict:
+    """
+    Semantic search combining the user query with a keyword's example text, for
+    keywords whose phrases matched no chunk. The stored keyword vector is mixed
+    into the query vector locally when both are available; otherwise the
+    combined text is embedded through the embedding caller.
+    
+    Returns:
+        Dict with "candidates" (chunk dicts by id) and "ranked_ids"
+    """
+    if query_embedding is not None and keyword_embedding is not None:
+        expanded_embedding = combine_embeddings(query_embedding, keyword_embedding)
+    else:
+        expanded_text = f"{message} {keyword.example_text}"
+        expanded_embedding = await embedding_caller.call(
+            lambda api_key: get_embeddings(api_key).embed_query(expanded_text),
+            priority=PRIORITY_INTERACTIVE
+        )
+    keyword_results = await asyncio.to_thread(
+        collection.query,
+        query_embeddings=[expanded_embedding],
+        n_results=3,
+        where=build_where_filter(scope),
+        include=["documents", "metadatas", "distances", "embeddings"]
+    )
+    candidates = {}
+    for i, chunk_id in enumerate(keyword_results['ids'][0]):
+        candidates[chunk_id] = {
+            "text": keyword_results['documents'][0][i],
+            "metadata": keyword_results['metadatas'][0][i],
+            "embedding": keyword_results['embeddings'][0][i]
+        }
+    return {"candidates": candidates, "ranked_ids": keyword_results['ids'][0]}
+
+def fuse_and_pack(
+    mode: ChatMode,
+    collection,
+    semantic_results: dict,
+    lexical: dict,
+    keyword_results: List[dict],
+    scope: Optional[dict] = None,
+    expand_neighbors: bool = False
+):
+    """
+    Fuse the vector, lexical and keyword candidates with reciprocal rank
+    fusion, pick a diverse top-k with MMR and pack it into the token budget.
+    
+    Returns:
+        Tuple of the packed chunks, packing stats and the number of candidates considered
+    """
+    # Candidate chunks by id, plus one ranked id list per retriever for fusion
+    candidates = {}
+    ranked_lists = []
+    
+    for i, chunk_id in enumerate(semantic_results['ids']):
+        candidates[chunk_id] = {
+            "text": semantic_results['documents'][i],
+            "metadata": semantic_results['metadatas'][i],
+            "embedding": semantic_results['embeddings'][i]
+        }
+    # Cut off by distance relative to the best hit instead of a fixed result count
+    semantic_ids = filter_by_distance(
+        semantic_results['ids'],
+        semantic_results['distances'],
+        DISTANCE_CUTOFF_RATIO
+    )
+    ranked_lists.append(semantic_ids)
+    
+    for chunk_id, candidate in lexical["candidates"].items():
+        candidates.setdefault(chunk_id, candidate)
+    ranked_lists.extend(lexical["ranked_lists"])
+    for result in keyword_results:
+        for chunk_id, candidate in result["candidates"].items():
+            candidates.setdefault(chunk_id, candidate)
+        ranked_lists.append(result["ranked_ids"])
+    
+    # Fuse vector and BM25 rankings with reciprocal rank fusion
+    fused_scores = reciprocal_rank_scores(ranked_lists)
+    fused_ids = sorted(fused_scores, key=lambda chunk_id: fused_scores[chunk_id], reverse=True)[:HYBRID_MAX_CHUNKS]
+    
+    # Retrieval confidence for model routing: how close the best vector hit is,
+    # and how far the top fused chunk leads the runner-up
+    best_distance = semantic_results['distances'][0] if semantic_results['distances'] else None
+    if len(fused_ids) >= 2:
+        fused_margin = 1 - fused_scores[fused_ids[1]] / fused_scores[fused_ids[0]]
+    else:
+        fused_margin = 1.0 if fused_ids else 0.0
+    
+    # Lexical-only hits have no embedding yet; fetch them locally in one call
+    missing_ids = [chunk_id for chunk_id in fused_ids if candidates[chunk_id].get("embedding") is None]
+    if missing_ids:
+        stored = collection.get(ids=missing_ids, include=["embeddings"])
+        for chunk_id, embedding in zip(stored['ids'], stored['embeddings']):
+            candidates[chunk_id]["embedding"] = embedding
+        fused_ids = [chunk_id for chunk_id in fused_ids if candidates[chunk_id].get("embedding") is not None]
+    
+    # Pick a diverse top-k so adjacent, near-identical chunks don't crowd the context
+    if len(fused_ids) > MMR_TOP_K:
+        best_score = fused_scores[fused_ids[0]]
+        selected = mmr_select(
+            [candidates[chunk_id]["embedding"] for chunk_id in fused_ids],
+            [fused_scores[chunk_id] / best_score for chunk_id in fused_ids],
+            MMR_TOP_K
+        )
+        fused_ids = [fused_ids[i] for i in selected]
+    
+    selected_chunks = [
+        {"id": chunk_id, "text": candidates[chunk_id]["text"], "metadata": candidates[chunk_id]["metadata"]}
+        for chunk_id in fused_ids
+    ]
+    if expand_neighbors:
+        selected_chunks = expand_with_neighbors(collection, selected_chunks, scope)
+    
+    # Drop near-duplicates and trim the context to the mode's token budget
+    packed_chunks, pack_stats = pack_context(
+        selected_chunks,
+        CONTEXT_TOKEN_BUDGETS.get(mode.value, CONTEXT_TOKEN_BUDGETS["NONE"])
+    )
+    pack_stats["best_distance"] = best_distance
+    pack_stats["fused_margin"] = fused_margin
+    return packed_chunks, pack_stats, len(selected_chunks)
+
+async def retrieve_context(
+    user_id: int,
+    message: str,
+    mode: ChatMode,
+    applicable_keywords: list,
+    collection,
+    semantic_results: dict,
+    scope: Optional[dict] = None,
+    query_embedding: Optional[list] = None,
+    keyword_embeddings: Optional[dict] = None,
+    expand_neighbors: bool = False,
+    lexical: Optional[dict] = None,
+    timer: Optional[StageTimer] = None
+):
+    """
+    Build the packed context for a question from its vector search results.
+    
+    Args:
+        user_id: ID of the user whose documents are searched
+        message: The user's question
+        mode: Chat mode, selects the context token budget
+        applicable_keywords: Keywords matched in the message
+        collection: The user's ChromaDB collection
+        semantic_results: Single-query Chroma results (see get_query_results)
+        scope: Optional retrieval scope (see get_retrieval_scope)
+        query_embedding: The question's embedding, expanded locally per keyword
+        keyword_embeddings: Stored example-text embedding per keyword id
+        expand_neighbors: Add the previous and next chunks of the top hits
+        lexical: Result of lexical_candidates when already computed for this scope
+        timer: Stage timer of the calling request
+    
+    Returns:
+        Tuple of the packed chunks, packing stats and the number of candidates considered
+    """
+    timer = timer or StageTimer()
+    if lexical is None:
+        lexical = await timer.run_optional(
+            "lexical_search", None,
+            lexical_candidates, user_id, message, applicable_keywords, collection, scope,
+            timeout=STAGE_TIMEOUTS["lexical_search"]
+        )
+    if lexical is None:
+        lexical = {"candidates": {}, "ranked_lists": [], "unresolved_keywords": list(applicable_keywords)}
+    
+    # Keywords left unresolved each need a vector search; they don't depend on each other
+    keyword_stages = [f"keyword_search:{keyword.id}" for keyword in lexical["unresolved_keywords"]]
+    keyword_results = await asyncio.gather(*[
+        timer.run_optional(
+            stage, None,
+            keyword_vector_candidates,
+            message,
+            keyword,
+            collection,
+            scope,
+            query_embedding,
+            keyword_embeddings.get(keyword.id) if keyword_embeddings else None,
+            timeout=STAGE_TIMEOUTS["keyword_search"],
+            deps=("embed_query", "keyword_embeddings")
+        )
+        for stage, keyword in zip(keyword_stages, lexical["unresolved_keywords"])
+    ])
+    
+    return await timer.run(
+        "fuse",
+        fuse_and_pack,
+        mode,
+        collection,
+        semantic_results,
+        lexical,
+        [result for result in keyword_results if result is not None],
+        scope,
+        expand_neighbors,
+        timeout=STAGE_TIMEOUTS["fuse"],
+        deps=("vector_search", "lexical_search", *keyword_stages)
+    )
+
+def rank_chunk_ids(user_id: int, message: str, chunk_ids: List[str]) -> List[str]:
+    """Order chunk ids by BM25 relevance to the question; ids the question doesn't match keep their order, last."""
+    ranked_ids = [hit["id"] for hit in lexical_index.search(user_id, message, limit=len(chunk_ids), chunk_ids=chunk_ids)]
+    return ranked_ids + [chunk_id for chunk_id in chunk_ids if chunk_id not in ranked_ids]
+
+def get_chunks_by_id(collection, chunk_ids: List[str], scope: Optional[dict] = None, include_embeddings: bool = False) -> List[dict]:
+    """Fetch chunks by id from Chroma (no embedding or vector search), in the given order and within scope."""
+    if not chunk_ids:
+        return []
+    include = ["documents", "metadatas", "embeddings"] if include_embeddings else ["documents", "metadatas"]
+    stored = collection.get(ids=chunk_ids, include=include)
+    stored_chunks = {}
+    for i, chunk_id in enumerate(stored['ids']):
+        if not metadata_in_scope(stored['metadatas'][i], scope):
+            continue
+        stored_chunks[chunk_id] = {"id": chunk_id, "text": stored['documents'][i], "metadata": stored['metadatas'][i]}
+        if include_embeddings:
+            stored_chunks[chunk_id]["embedding"] = stored['embeddings'][i]
+    return [stored_chunks[chunk_id] for chunk_id in chunk_ids if chunk_id in stored_chunks]
+
+def expand_with_neighbors(collection, chunks: List[dict], scope: Optional[dict] = None) -> List[dict]:
+    """
+    Surround the top hits with their previous and next chunks, using the
+    neighbor ids recorded at ingestion (one collection.get, no vector search).
+    Neighbors are placed right next to their hit, so packing keeps them ahead
+    of lower-ranked hits.
+    """
+    top_chunks = chunks[:NEIGHBOR_EXPANSION_TOP_K]
+    selected_ids = {chunk["id"] for chunk in chunks}
+    neighbor_ids = []
+    for chunk in top_chunks:
+        for key in ("prev_chunk_id", "next_chunk_id"):
+            neighbor_id = chunk["metadata"].get(key)
+            if neighbor_id and neighbor_id not in selected_ids and neighbor_id not in neighbor_ids:
+                neighbor_ids.append(neighbor_id)
+    neighbors = {chunk["id"]: chunk for chunk in get_chunks_by_id(collection, neighbor_ids, scope)}
+    if not neighbors:
+        return chunks
+    
+    expanded = []
+    for chunk in top_chunks:
+        previous_chunk = neighbors.pop(chunk["metadata"].get("prev_chunk_id"), None)
+        next_chunk = neighbors.pop(chunk["metadata"].get("next_chunk_id"), None)
+        expanded.extend(neighbor for neighbor in (previous_chunk, chunk, next_chunk) if neighbor is not None)
+    expanded.extend(chunks[NEIGHBOR_EXPANSION_TOP_K:])
+    logger.info(f"[ask] Expanded top {len(top_chunks)} hits with {len(expanded) - len(chunks)} neighboring chunks")
+    return expanded
+
+def retrieve_section_chunks(user_id: int, message: str, mode: ChatMode, collection, section_numbers: List[str], scope: Optional[dict] = None):
+    """
+    Fast path for questions that name CSI sections ("what does 08 71 00 require?"):
+    resolve the sections to their chunks through the ingestion-time lookup table
+    and fetch them by id, with no embedding call or vector search.
+    
+    Chunks are ordered by BM25 relevance to the question within the named
+    sections, then in document order, before packing.
+    
+    Returns:
+        Tuple of the packed chunks, packing stats and the number of candidates
+        considered; the packed chunks are empty when the sections aren't indexed
+    """
+    section_chunk_ids = lexical_index.get_section_chunk_ids(user_id, section_numbers)
+    if not section_chunk_ids:
+        return [], None, 0
+    
+    ranked_ids = rank_chunk_ids(user_id, message, section_chunk_ids)[:SECTION_LOOKUP_MAX_CHUNKS]
+    chunks = get_chunks_by_id(collection, ranked_ids, scope)
+    if not chunks:
+        return [], None, 0
+    
+    packed_chunks, pack_stats = pack_context(chunks, CONTEXT_TOKEN_BUDGETS.get(mode.value, CONTEXT_TOKEN_BUDGETS["NONE"]))
+    logger.info(f"[ask] Section lookup for {section_numbers} resolved {len(chunks)} chunks without vector search")
+    return packed_chunks, pack_stats, len(chunks)
+
+def build_context_prompt(mode: ChatMode, message: str, applicable_keywords: list, packed_chunks: list, pack_stats: dict, candidate_count: int) -> str:
+    """Combine packed chunks into the final prompt and log the tokens saved by packing."""
+    context = "\n\n".join(chunk["text"] for chunk in packed_chunks)
+    prompt = build_prompt(mode, context, message, applicable_keywords)
+    prompt_tokens = estimate_tokens(prompt)
+    unpacked_prompt_tokens = prompt_tokens - pack_stats["packed_tokens"] + pack_stats["candidate_tokens"]
+    logger.info(
+        f"[ask] Prompt tokens: {prompt_tokens} (saved ~{unpacked_prompt_tokens - prompt_tokens}; "
+        f"{len(packed_chunks)}/{candidate_count} chunks kept, {pack_stats['duplicates']} near-duplicates, "
+        f"{pack_stats['dropped']} over budget)"
+    )
+    return prompt
+
+def build_ask_response(response: str, packed_chunks: list, applicable_keywords: list) -> dict:
+    # Create response with applicable keywords
+    return {
+        "response": response,
+        "chunks": [
+            {
+                "text": chunk["text"],
+                "metadata": chunk["metadata"]
+            }
+            for chunk in packed_chunks
+        ],
+        "applicable_keywords": [
+            {
+                "id": keyword.id,
+                "term": keyword.term,
+                "example_text": keyword.example_text
+            }
+            for keyword in applicable_keywords
+        ]
+    }
+
+def build_degraded_response(response: str, packed_chunks: list, applicable_keywords: list) -> dict:
+    """Response for an answer cut off by the request deadline: the partial answer, or only the sources."""
+    result = build_ask_response(response or SOURCES_ONLY_RESPONSE, packed_chunks, applicable_keywords)
+    result["degraded"] = "partial" if response else "sources_only"
+    return result
+
+async def generate_answer(
+    route: str,
+    prompt: str,
+    timer: StageTimer,
+    deps: tuple = (),
+    allow_partial: bool = False,
+    tier: Optional[str] = None
+) -> Tuple[str, bool]:
+    """
+    Generate an answer with the route's model and record the route's latency and token spend.
+
+    The answer is streamed, so when the stage times out the request to the
+    model is cancelled and the text generated so far is still available. With
+    HEDGING_ENABLED, a request slow to produce its first token once it has
+    a slot is hedged, if another slot is free.
+    Calls go through the model's resilient caller (API key pool, retries,
+    circuit breaker), which picks the key each attempt uses. Every request
+    to the model, hedges included, holds a slot from the tier-weighted
+    generation scheduler while it streams, and the wait for the slot counts
+    towards the stage timeout.
+
+    Args:
+        allow_partial: Return the partial answer on timeout, or when the
+            model's circuit is open, instead of raising
+        tier: Subscription tier the generation is scheduled under
+
+    Returns:
+        Tuple of the answer and whether it was generated in full
+
+    Raises:
+        GenerationShed: If the scheduler's queue is full and the generation was shed
+    """
+    settings = ROUTES[route]
+    chat_caller = get_chat_caller(settings["model"])
+    pieces = []
+
+    async def start_stream(on_start=None, hedge=False):
+        # A hedge takes its own slot, so LLM_MAX_CONCURRENCY caps real generations,
+        # and is only sent if one is free rather than queueing for it
+        async with generation_scheduler.slot(tier, wait=not hedge):
+            if on_start is not None:
+                on_start()
+            async for piece in chat_caller.stream(
+                lambda api_key: create_chat_chain(
+                    api_key=api_key, model=settings["model"], max_output_tokens=settings["max_output_tokens"]
+                ).astream(prompt)
+            ):
+                yield piece
+
+    async def stream_answer():
+        if HEDGING_ENABLED:
+            stream = hedged_stream(start_stream, get_hedge_policy(settings["model"]), generation_scheduler.has_free_slot)
+        else:
+            stream = start_stream()
+        async for piece in stream:
+            pieces.append(piece)
+        return "".join(pieces)
+
+    complete = True
+    try:
+        response = await timer.run("llm", stream_answer, timeout=STAGE_TIMEOUTS["llm"], deps=deps)
+    except (StageTimeout, CircuitOpenError) as e:
+        if not allow_partial:
+            raise
+        logger.warning(f"[ask] {str(e)}, returning {len(pieces)} streamed pieces")
+        response = "".join(pieces)
+        complete = False
+    
+    latency_ms = timer.duration_ms("llm")
+    prompt_tokens = estimate_tokens(prompt)
+    output_tokens = estimate_tokens(response)
+    route_metrics.record(route, latency_ms, prompt_tokens, output_tokens)
+    logger.info(
+        f"[ask] Route {route} ({settings['model']}): {latency_ms:.0f}ms, "
+        f"~{prompt_tokens} prompt tokens, ~{output_tokens} output tokens"
+    )
+    return response, complete
+
+async def answer_question(
+    request: ChatRequest,
+    user_id: int,
+    db: Session,
+    applicable_keywords: list,
+    scope: Optional[dict],
+    cache_key: tuple,
+    timer: StageTimer,
+    tier: Optional[str] = None
+) -> dict:
+    """Retrieve context and generate the answer for an /ask request that missed the answer cache."""
+    # Small talk is answered by the fast model without any retrieval
+    if classify_message(request.message, applicable_keywords) == ROUTE_CHIT_CHAT:
+        response, complete = await generate_answer(
+            ROUTE_CHIT_CHAT, build_chit_chat_prompt(request.message), timer, deps=("keywords",), allow_partial=True, tier=tier
+        )
+        timer.log_summary("[ask]")
+        if not complete:
+            return {**build_degraded_response(response, [], applicable_keywords), "cached": False}
+        result = build_ask_response(response, [], applicable_keywords)
+        answer_cache.put(cache_key, result)
+        return {**result, "cached": False}
+
+    # Get relevant chunks from ChromaDB using user-specific collection
+    collection_name = get_collection_name(user_id)
+    collection = chroma_client.get_collection(collection_name)
+
+    # Questions naming spec sections are answered from those sections directly
+    query_embedding = None
+    packed_chunks = []
+    referenced_sections = extract_section_references(request.message)
+    context_stage = "section_lookup"
+    if referenced_sections:
+        packed_chunks, pack_stats, candidate_count = await timer.run(
+            "section_lookup",
+            retrieve_section_chunks,
+            user_id,
+            request.message,
+            request.mode,
+            collection,
+            referenced_sections,
+            scope,
+            timeout=STAGE_TIMEOUTS["section_lookup"],
+            deps=("keywords",)
+        )
+
+    if not packed_chunks:
+        context_stage = "fuse"
+        trade_scope = get_trade_scope(request.mode, scope)
+
+        # Independent stages run concurrently: the query embedding (an API call)
+        # overlaps the local keyword-vector load and lexical lookups
+        query_embedding, keyword_embeddings, lexical = await asyncio.gather(
+            timer.run(
+                "embed_query", query_embedding_batcher.embed_query, request.message,
+                timeout=STAGE_TIMEOUTS["embed_query"], deps=("keywords",)
+            ),
+            timer.run_optional(
+                "keyword_embeddings", {}, get_keyword_embeddings, db, applicable_keywords,
+                timeout=STAGE_TIMEOUTS["keyword_embeddings"], deps=("keywords",)
+            ),
+            timer.run_optional(
+                "lexical_search", None,
+                lexical_candidates, user_id, request.message, applicable_keywords, collection, trade_scope,
+                timeout=STAGE_TIMEOUTS["lexical_search"], deps=("keywords",)
+            )
+        )
+
+        # Paraphrases of a cached question can reuse its answer (fuzzy mode only)
+        cached_response = answer_cache.get_similar(cache_key, query_embedding)
+        if cached_response is not None:
+            return {**cached_response, "cached": True}
+
+        # Route the question to its most relevant CSI sections within the mode's
+        # trade, then over-fetch a candidate pool once, with embeddings for MMR
+        semantic_results, search_scope = await timer.run(
+            "vector_search",
+            search_chunks, user_id, collection, query_embedding, request.mode, scope,
+            timeout=STAGE_TIMEOUTS["vector_search"],
+            deps=("embed_query",)
+        )
+        if search_scope is not trade_scope:
+            # The trade filter was dropped, so lexical candidates are recomputed for the wider scope
+            lexical = None
+
+        packed_chunks, pack_stats, candidate_count = await retrieve_context(
+            user_id,
+            request.message,
+            request.mode,
+            applicable_keywords,
+            collection,
+            semantic_results,
+            search_scope,
+            query_embedding,
+            keyword_embeddings,
+            request.expand_neighbors,
+            lexical=lexical,
+            timer=timer
+        )
+
+    # Prepare prompt with context and include applicable keywords if any
+    prompt = build_context_prompt(request.mode, request.message, applicable_keywords, packed_chunks, pack_stats, candidate_count)
+
+    # Only hard questions are escalated to the large model
+    route = classify_question(request.message, applicable_keywords, packed_chunks, pack_stats)
+    response, complete = await generate_answer(
+        route, prompt, timer, deps=(context_stage,), allow_partial=True, tier=tier
+    )
+    timer.log_summary("[ask]")
+
+    # Answers cut off by the deadline are returned with their sources but not cached
+    if not complete:
+        return {**build_degraded_response(response, packed_chunks, applicable_keywords), "cached": False}
+
+    result = build_ask_response(response, packed_chunks, applicable_keywords)
+    answer_cache.put(cache_key, result, query_embedding)
+    return {**result, "cached": False}
+
 @app.post("/ask")
-async def ask(request: ChatRequest, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def ask(
+    request: ChatRequest,
+    deadline_ms: Optional[int] = Header(None, alias="X-Deadline-Ms"),
+    current_user: models.User = Depends(get_rate_limited_user),
+    db: Session = Depends(get_db)
+):
     try:
         logger.info(f"[ask] Processing request for user_id: {current_user.id}, message: {request.message[:50]}...")
+        # Every stage below is bounded by the time left before the request deadline.
+        # Identical requests joining this one share its deadline.
+        timer = StageTimer(deadline_seconds=get_ask_deadline(current_user, deadline_ms))
             
-        # Get user keywords from database
-        user_keywords = db.query(Keyword).filter(Keyword.user_id == current_user.id).all()
+        # Find applicable keywords with the user's compiled matcher (rebuilt only when keywords change).
+        # This runs before anything else so cache hits cost no embedding call.
+        applicable_keywords = await timer.run(
+            "keywords",
+            lambda: get_keyword_matcher(current_user.id, db).match(request.message),
+            timeout=STAGE_TIMEOUTS["keywords"]
+        )
+
+        scope = get_retrieval_scope(request)
         
-        # Find applicable keywords in the message using helper function
-        applicable_keywords = find_applicable_keywords(request.message, user_keywords)
+        # Serve repeated questions against an unchanged corpus from the answer cache
+        cache_key = answer_cache.make_key(
+            current_user.id,
+            request.message,
+            request.mode.value,
+            [kw.id for kw in applicable_keywords],
+            get_corpus_version(current_user.id),
+            get_cache_scope(scope, request.expand_neighbors)
+        )
+        cached_response = answer_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info(f"[ask] Answer cache hit for user_id: {current_user.id}")
+            return {**cached_response, "cached": True}
 
-        # Get relevant chunks from ChromaDB using user-specific collection
-        collection_name = get_collection_name(current_user.id)
-        collection = chroma_client.get_collection(collection_name)
+        # Identical questions already being answered are joined rather than repeated
+        result, shared = await ask_single_flight.do(
+            cache_key,
+            lambda: answer_question(
+                request, current_user.id, db, applicable_keywords, scope, cache_key, timer, current_user.subscription_tier
+            )
+        )
+        if shared:
+            logger.info(f"[ask] Joined an in-flight identical request for user_id: {current_user.id}")
+        return result
+    except StageTimeout as e:
+        logger.error(f"[ask] {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except (CircuitOpenError, GenerationShed) as e:
+        logger.error(f"[ask] {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except Exception as e:
+        logger.error(f"Error in ask: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/ask-batch")
+async def ask_batch(
+    request: BatchChatRequest,
+    http_request: Request,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Answer a list of questions in one request, streaming each answer back as NDJSON as it completes.
+    
+    All uncached questions are embedded in one call and searched in one multi-query
+    Chroma call; questions are then answered with bounded concurrency, each
+    within the tier's /ask deadline. Blocking setup stages (keyword matcher,
+    Chroma queries) run in worker threads.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="At least one question is required")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    # Each question counts against the user's rate limit
+    check_rate_limit(http_request, current_user, cost=len(request.questions))
+    
+    timer = StageTimer()
+    try:
+        logger.info(f"[ask-batch] Processing {len(request.questions)} questions for user_id: {current_user.id}")
         
-        # Start with semantic search using the original query
-        query_embedding = embeddings.embed_query(request.message)
-        semantic_results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=3
+        matcher = await timer.run(
+            "keywords", get_keyword_matcher, current_user.id, db, timeout=STAGE_TIMEOUTS["keywords"]
         )
+        corpus_version = get_corpus_version(current_user.id)
+        scope = get_retrieval_scope(request)
         
-        # Extract results from semantic search
-        chunks = semantic_results['documents'][0]
-        metadatas = semantic_results['metadatas'][0]
-        distances = semantic_results['distances'][0]
+        # Resolve keywords and cached answers for every question up front
+        questions = []
+        for index, message in enumerate(request.questions):
+            applicable_keywords = matcher.match(message)
+            cache_key = answer_cache.make_key(
+                current_user.id,
+                message,
+                request.mode.value,
+                [kw.id for kw in applicable_keywords],
+                corpus_version,
+                get_cache_scope(scope, request.expand_neighbors)
+            )
+            questions.append({
+                "index": index,
+                "message": message,
+                "applicable_keywords": applicable_keywords,
+                "cache_key": cache_key,
+                "cached_response": answer_cache.get(cache_key)
+            })
+        pending = [question for question in questions if question["cached_response"] is None]
         
-        # If we have applicable keywords, enhance the results
-        if applicable_keywords:
-            # Create a combined query using the original query and keywords
-            combined_query = request.message
-            keyword_terms = [kw.term for kw in applicable_keywords]
-            
-            # For each applicable keyword, do an additional search
-            all_chunks = []
-            all_metadatas = []
-            all_distances = []
-            seen_ids = set()  # Keep track of chunks we've already seen
+        semantic_results = None
+        collection = None
+        if pending:
+            collection = chroma_client.get_collection(get_collection_name(current_user.id))
+            # One embedding call and one multi-query Chroma call for the whole batch.
+            # Section routing is skipped here since routed filters differ per question.
+            question_embeddings = await timer.run(
+                "embed_query",
+                embedding_caller.call,
+                lambda api_key: get_embeddings(api_key).embed_documents([question["message"] for question in pending]),
+                timeout=STAGE_TIMEOUTS["embed_query"],
+                deps=("keywords",)
+            )
+            trade_scope = get_trade_scope(request.mode, scope)
+            semantic_results = await timer.run(
+                "vector_search",
+                lambda: collection.query(
+                    query_embeddings=question_embeddings,
+                    n_results=SEMANTIC_CANDIDATES,
+                    where=build_where_filter(trade_scope),
+                    include=["documents", "metadatas", "distances", "embeddings"]
+                ),
+                timeout=STAGE_TIMEOUTS["vector_search"],
+                deps=("embed_query",)
+            )
+            keyword_embeddings = await timer.run_optional(
+                "keyword_embeddings", {},
+                get_keyword_embeddings,
+                db,
+                list({kw.id: kw for question in pending for kw in question["applicable_keywords"]}.values()),
+                timeout=STAGE_TIMEOUTS["keyword_embeddings"]
+            )
+            for i, question in enumerate(pending):
+                question["query_embedding"] = question_embeddings[i]
+                question["semantic_results"] = get_query_results(semantic_results, i)
+                question["search_scope"] = trade_scope
             
-            # First prioritize keyword-specific searches
-            for keyword in applicable_keywords:
-                # Create a query that combines the user query with the keyword example text
-                keyword_query = f"{request.message} {keyword.example_text}"
-                keyword_embedding = embeddings.embed_query(keyword_query)
-                
-                # Get results based on the keyword-enhanced query
-                # Use more results for keywords since we're prioritizing them
-                keyword_results = collection.query(
-                    query_embeddings=[keyword_embedding],
-                    n_results=3
+            # Questions the trade filter starves are searched again across all divisions, in one call
+            low_recall = [question for question in pending if len(question["semantic_results"]["ids"]) < TRADE_FILTER_MIN_RESULTS]
+            if trade_scope is not scope and low_recall:
+                logger.info(f"[ask-batch] {request.mode.value} trade filter starved {len(low_recall)} questions, searching all divisions")
+                fallback_results = await timer.run(
+                    "vector_search:all_divisions",
+                    lambda: collection.query(
+                        query_embeddings=[question["query_embedding"] for question in low_recall],
+                        n_results=SEMANTIC_CANDIDATES,
+                        where=build_where_filter(scope),
+                        include=["documents", "metadatas", "distances", "embeddings"]
+                    ),
+                    timeout=STAGE_TIMEOUTS["vector_search"]
                 )
-                
-                # Add unique results
-                for i, chunk in enumerate(keyword_results['documents'][0]):
-                    chunk_id = keyword_results['ids'][0][i]
-                    if chunk_id not in seen_ids:
-                        all_chunks.append(chunk)
-                        all_metadatas.append(keyword_results['metadatas'][0][i])
-                        all_distances.append(keyword_results['distances'][0][i])
-                        seen_ids.add(chunk_id)
-            
-            # Then add semantic search results that weren't already included
-            for i, chunk in enumerate(chunks):
-                chunk_id = semantic_results['ids'][0][i]
-                if chunk_id not in seen_ids:
-                    all_chunks.append(chunk)
-                    all_metadatas.append(metadatas[i])
-                    all_distances.append(distances[i])
-                    seen_ids.add(chunk_id)
-            
-            # Update the chunks and metadata with the enhanced results
-            chunks = all_chunks
-            metadatas = all_metadatas
-        
-        # Combine relevant chunks into context
-        context = "\n\n".join(chunks)
-        
-        # Create chat chain
-        chain = create_chat_chain()
-        
-        # Prepare prompt with context and include applicable keywords if any
-        prompt = f"""
-            {get_prompt_framing(request.mode)}
-
-                <context>
-                {context}
-                </context>
-
-                <question>
-                {request.message}
-                </question>
-        """
-        
-        # Add keyword section if applicable keywords were found
-        if applicable_keywords:
-            keyword_section = "\n\nAdditional instructions for specific keywords:\n"
-            for keyword in applicable_keywords:
-                keyword_section += f"- {keyword.term}: {keyword.example_text}\n"
-            
-            prompt += keyword_section
-            
-        response = chain.invoke(prompt)
-        
-        # Create response with applicable keywords
-        return {
-            "response": response,
-            "chunks": [
-                {
-                    "text": chunk,
-                    "metadata": metadata
-                }
-                for chunk, metadata in zip(chunks, metadatas)
-            ],
-            "applicable_keywords": [
-                {
-                    "id": keyword.id,
-                    "term": keyword.term,
-                    "example_text": keyword.example_text
-                }
-                for keyword in applicable_keywords
-            ]
-        }
+                for i, question in enumerate(low_recall):
+                    question["semantic_results"] = get_query_results(fallback_results, i)
+                    question["search_scope"] = scope
+    except StageTimeout as e:
+        logger.error(f"[ask-batch] {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.error(f"Error in ask: {str(e)}", exc_info=True)
+        logger.error(f"Error in ask-batch: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    
+    async def answer(question: dict) -> dict:
+        try:
+            # Bound concurrent questions so a batch can't monopolize the LLM quota.
+            # Each question gets the tier's /ask deadline once it is being worked on.
+            async with semaphore:
+                timer = StageTimer(deadline_seconds=get_ask_deadline(current_user))
+                packed_chunks, pack_stats, candidate_count = await retrieve_context(
+                    current_user.id,
+                    question["message"],
+                    request.mode,
+                    question["applicable_keywords"],
+                    collection,
+                    question["semantic_results"],
+                    question["search_scope"],
+                    question["query_embedding"],
+                    keyword_embeddings,
+                    request.expand_neighbors,
+                    timer=timer
+                )
+                prompt = build_context_prompt(
+                    request.mode,
+                    question["message"],
+                    question["applicable_keywords"],
+                    packed_chunks,
+                    pack_stats,
+                    candidate_count
+                )
+                route = classify_question(question["message"], question["applicable_keywords"], packed_chunks, pack_stats)
+                response, complete = await generate_answer(
+                    route, prompt, timer, deps=("fuse",), allow_partial=True, tier=current_user.subscription_tier
+                )
+            # Answers cut off by the deadline are returned with their sources but not cached
+            if not complete:
+                result = build_degraded_response(response, packed_chunks, question["applicable_keywords"])
+                return {"status": "answered", "index": question["index"], "question": question["message"], **result, "cached": False}
+            result = build_ask_response(response, packed_chunks, question["applicable_keywords"])
+            answer_cache.put(question["cache_key"], result, question["query_embedding"])
+            return {"status": "answered", "index": question["index"], "question": question["message"], **result, "cached": False}
+        except Exception as e:
+            logger.error(f"[ask-batch] Error answering question {question['index']}: {str(e)}", exc_info=True)
+            return {"status": "error", "index": question["index"], "question": question["message"], "error": str(e)}
+    
+    async def generate():
+        for question in questions:
+            if question["cached_response"] is not None:
+                yield json.dumps({
+                    "status": "answered",
+                    "index": question["index"],
+                    "question": question["message"],
+                    **question["cached_response"],
+                    "cached": True
+                }) + "\n"
+        
+        tasks = [asyncio.create_task(answer(question)) for question in pending]
+        try:
+            for next_answer in asyncio.as_completed(tasks):
+                yield json.dumps(await next_answer) + "\n"
+        finally:
+            # Client went away; don't keep spending quota on answers nobody will read
+            for task in tasks:
+                task.cancel()
+        
+        yield json.dumps({"status": "complete", "total": len(questions)}) + "\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
 
 async def process_chunks_with_updates(chunks, document, collection, embeddings, rate_limiter):
     logger.info(f"Starting processing of {len(chunks)} chunks for document: {document.filename}")
@@ -508,9 +1492,21 @@ async def upload_pdf(
         db.commit()
         db.refresh(document)
         
+        # Chunks are matched against the user's keyword phrases as they are ingested,
+        # with the matcher rebuilt if keywords change mid-upload (edits re-index
+        # the chunks already stored)
+        def get_phrase_matcher():
+            return get_keyword_phrase_matcher(current_user.id, db)
+        
         async def generate():
             try:
-                async for progress in process_pdf(file_content, file.filename, current_user.id):
+                async for progress in process_pdf(
+                    file_content,
+                    file.filename,
+                    current_user.id,
+                    document_id=document.id,
+                    get_phrase_matcher=get_phrase_matcher
+                ):
                     # Add document_id to progress updates
                     progress["document_id"] = document.id
                     yield json.dumps(progress) + "\n"
@@ -533,6 +1529,9 @@ async def upload_pdf(
                 # Delete the document from database if processing failed
                 db.delete(document)
                 db.commit()
+            finally:
+                # Chunks may have been added even if processing failed part way
+                bump_document_version(current_user.id)
         
         return StreamingResponse(
             generate(),
@@ -554,6 +1553,26 @@ async def health_check():
     """
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Answer cache, request coalescing, per-route model latency/token,
+    per-model hedging, provider resilience, query embedding batch,
+    per-tier generation scheduling, admission control and tenant rate
+    limit counters
+    """
+    return {
+        "answer_cache": answer_cache.stats(),
+        "single_flight": ask_single_flight.stats(),
+        "routes": route_metrics.stats(),
+        "hedging": hedging_stats(),
+        "resilience": resilience_stats(),
+        "query_embeddings": query_embedding_batcher.stats(),
+        "generation": generation_scheduler.stats(),
+        "admission": admission_stats(),
+        "tenant_rate_limit": tenant_rate_limiter.stats()
+    }
+
 @app.get("/chat_modes")
 async def chat_modes():
     return [mode.value for mode in ChatMode]
@@ -569,8 +1588,17 @@ def list_documents(user_id: int, db: Session = Depends(get_db)):
     documents = db.query(Document).filter(Document.user_id == user_id).all()
     return documents
 
+async def precompute_keyword_embeddings(db: Session, keywords: list):
+    """Embed keyword example texts at write time so /ask doesn't have to."""
+    try:
+        await store_keyword_embeddings(db, keywords, priority=PRIORITY_INGESTION)
+    except Exception as e:
+        # /ask embeds and stores any missing vectors on first use
+        db.rollback()
+        logger.error(f"[keywords] Error embedding {len(keywords)} keywords: {str(e)}")
+
 @app.post("/keywords/", response_model=KeywordSchema)
-def create_keyword(keyword: KeywordCreate, user_id: int, db: Session = Depends(get_db)):
+async def create_keyword(keyword: KeywordCreate, user_id: int, db: Session = Depends(get_db)):
     # Check if user exists
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
@@ -580,6 +1608,9 @@ def create_keyword(keyword: KeywordCreate, user_id: int, db: Session = Depends(g
     db.add(db_keyword)
     db.commit()
     db.refresh(db_keyword)
+    bump_keyword_version(user_id)
+    await precompute_keyword_embeddings(db, [db_keyword])
+    index_keywords(user_id, [db_keyword])
     return db_keyword
 
 @app.get("/keywords/{user_id}", response_model=list[KeywordSchema])
@@ -603,7 +1634,7 @@ def read_keyword(user_id: int, keyword_id: int, db: Session = Depends(get_db)):
     return keyword
 
 @app.put("/keywords/{user_id}/{keyword_id}", response_model=KeywordSchema)
-def update_keyword(
+async def update_keyword(
     user_id: int,
     keyword_id: int,
     keyword: KeywordCreate,
@@ -621,6 +1652,9 @@ def update_keyword(
     
     db.commit()
     db.refresh(db_keyword)
+    bump_keyword_version(user_id)
+    await precompute_keyword_embeddings(db, [db_keyword])
+    index_keywords(user_id, [db_keyword])
     return db_keyword
 
 @app.delete("/keywords/{user_id}/{keyword_id}")
@@ -632,8 +1666,11 @@ def delete_keyword(user_id: int, keyword_id: int, db: Session = Depends(get_db))
     if db_keyword is None:
         raise HTTPException(status_code=404, detail="Keyword not found")
     
+    delete_keyword_embedding(db, keyword_id)
     db.delete(db_keyword)
     db.commit()
+    delete_keywords(user_id, [keyword_id])
+    bump_keyword_version(user_id)
     return {"message": "Keyword deleted successfully"}
 
 @app.post("/keyword-upload")
@@ -731,6 +1768,7 @@ async def keyword_upload(
             
             logger.info(f"[{request_id}] Committing {len(created_keywords)} keywords to database")
             db.commit()
+            bump_keyword_version(user_id)
             
             # Refresh all created keywords to get their IDs
             for idx, keyword in enumerate(created_keywords, 1):
@@ -740,6 +1778,11 @@ async def keyword_upload(
                 except Exception as refresh_error:
                     logger.error(f"[{request_id}] Error refreshing keyword {idx}: {str(refresh_error)}", exc_info=True)
             
+            # Embed all example texts in batched calls
+            logger.info(f"[{request_id}] Embedding {len(created_keywords)} keyword example texts")
+            await precompute_keyword_embeddings(db, created_keywords)
+            index_keywords(user_id, created_keywords)
+            
             logger.info(f"[{request_id}] Successfully completed keyword upload process")
             return {
                 "message": f"Successfully extracted and saved {len(created_keywords)} keywords",
@@ -825,9 +1868,23 @@ async def delete_document(user_id: int, document_id: str, db: Session = Depends(
             logger.error(f"Error deleting document from ChromaDB: {str(e)}")
             # Continue with database deletion even if ChromaDB deletion fails
         
+        # Delete document from the lexical index
+        try:
+            lexical_index.delete_document(user_id, document_id)
+        except Exception as e:
+            logger.error(f"Error deleting document from lexical index: {str(e)}")
+        
+        # Delete the document's entries from the section index
+        try:
+            section_collection = chroma_client.get_collection(get_section_collection_name(user_id))
+            section_collection.delete(where={"document_id": document_id})
+        except Exception as e:
+            logger.error(f"Error deleting document from section index: {str(e)}")
+        
         # Delete document from database
         db.delete(document)
         db.commit()
+        bump_document_version(user_id)
         
         return {"message": "Document deleted successfully"}
         
@@ -869,10 +1926,23 @@ async def delete_all_user_documents(user_id: int, db: Session = Depends(get_db))
             logger.error(f"Error deleting ChromaDB collection: {str(e)}")
             # Continue with database deletion even if ChromaDB deletion fails
         
+        # Delete the user's lexical index
+        try:
+            lexical_index.delete_user(user_id)
+        except Exception as e:
+            logger.error(f"Error deleting lexical index: {str(e)}")
+        
+        # Delete the user's section index
+        try:
+            chroma_client.delete_collection(get_section_collection_name(user_id))
+        except Exception as e:
+            logger.error(f"Error deleting section index: {str(e)}")
+        
         # Delete all documents from database
         for document in documents:
             db.delete(document)
         db.commit()
+        bump_document_version(user_id)
         
         return {
             "message": f"Successfully deleted {document_count} documents and associated vector embeddings",
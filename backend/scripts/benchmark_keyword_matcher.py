@@ -0,0 +1,90 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+# Add the parent directory to the Python path to allow importing from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.helpers import find_applicable_keywords
+from app.utils.keyword_matcher import KeywordMatcher
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Terms that show up in real keyword extractions, padded out with synthetic ones
+SAMPLE_TERMS = [
+    "BOD", "base of design", "acceptable manufacturers", "luminaire", "UL 1598", "NFPA 70",
+    "hydraulic elevator", "seismic design category", "closer", "submittals", "warranty"
+]
+
+SAMPLE_MESSAGES = [
+    "What are the acceptable manufacturers and base of design for the luminaire fixtures?",
+    "What warranty period is specified for luminaires, and who is responsible for the warranty?",
+    "What compliance standards must electrical components meet, including UL 1598 and NFPA 70 references?",
+    "What seismic design requirements must the hydraulic elevator system comply with?"
+]
+
+
+def make_keywords(count: int, rng: random.Random):
+    keywords = []
+    for i in range(count):
+        if i < len(SAMPLE_TERMS):
+            term = SAMPLE_TERMS[i]
+        else:
+            term = " ".join(
+                "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(4, 10)))
+                for _ in range(rng.randint(1, 3))
+            )
+        keywords.append(SimpleNamespace(id=i, term=term, example_text=""))
+    return keywords
+
+
+def time_calls(func, iterations: int) -> float:
+    """Return mean milliseconds per call."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)])
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compiled keyword matcher against find_applicable_keywords")
+    parser.add_argument("--keywords", "-k", type=int, default=10000, help="Number of keywords (default: 10000)")
+    parser.add_argument("--iterations", "-i", type=int, default=200, help="Timed iterations (default: 200)")
+    args = parser.parse_args()
+
+    keywords = make_keywords(args.keywords, random.Random(0))
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # Both implementations must agree before timing means anything
+    for message in SAMPLE_MESSAGES:
+        expected = [keyword.id for keyword in find_applicable_keywords(message, keywords)]
+        actual = [keyword.id for keyword in matcher.match(message)]
+        if expected != actual:
+            raise SystemExit(f"Matcher disagrees with find_applicable_keywords for: {message}")
+
+    regex_ms = time_calls(lambda message: find_applicable_keywords(message, keywords), args.iterations)
+    matcher_ms = time_calls(matcher.match, args.iterations)
+
+    logger.info(f"{args.keywords} keywords, {args.iterations} iterations")
+    logger.info(f"find_applicable_keywords: {regex_ms:.3f}ms per message")
+    logger.info(f"KeywordMatcher.match:     {matcher_ms:.3f}ms per message ({regex_ms / matcher_ms:.0f}x faster)")
+    logger.info(f"KeywordMatcher build:     {build_ms:.1f}ms (once per keyword change)")
+
+
+if __name__ == "__main__":
+    main()
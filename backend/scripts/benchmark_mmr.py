@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the parent directory to the Python path to allow importing from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.retrieval import mmr_select
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+def make_candidates(num_candidates: int, dimensions: int, rng: np.random.Generator):
+    """
+    Build a candidate pool that looks like a real /ask result: a few clusters
+    of near-identical chunks (adjacent chunks of one section) plus noise.
+    """
+    num_clusters = max(1, num_candidates // 4)
+    centers = rng.normal(size=(num_clusters, dimensions))
+    assignments = rng.integers(0, num_clusters, size=num_candidates)
+    embeddings = centers[assignments] + 0.05 * rng.normal(size=(num_candidates, dimensions))
+    relevance = np.sort(rng.random(num_candidates))[::-1]
+    return embeddings, relevance
+
+
+def time_mmr(embeddings, relevance, top_k: int, iterations: int) -> np.ndarray:
+    """Time mmr_select, returning per-call latencies in milliseconds."""
+    # Warm up
+    for _ in range(50):
+        mmr_select(embeddings, relevance, top_k)
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        mmr_select(embeddings, relevance, top_k)
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-query overhead of MMR chunk selection")
+    parser.add_argument("--candidates", "-n", type=int, default=20, help="Candidate pool size (default: 20)")
+    parser.add_argument("--dimensions", "-d", type=int, default=768, help="Embedding dimensions (default: 768)")
+    parser.add_argument("--top-k", "-k", type=int, default=6, help="Chunks to select (default: 6)")
+    parser.add_argument("--iterations", "-i", type=int, default=2000, help="Timed iterations (default: 2000)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings, relevance = make_candidates(args.candidates, args.dimensions, rng)
+
+    logger.info(f"MMR over {args.candidates} x {args.dimensions} candidates, top_k={args.top_k}, {args.iterations} iterations")
+    # Chroma returns embeddings as Python lists, so the list timing (which
+    # includes the list -> array conversion) is what /ask actually pays
+    for label, inputs in [("ndarray", embeddings), ("list", embeddings.tolist())]:
+        timings_ms = time_mmr(inputs, relevance.tolist(), args.top_k, args.iterations)
+        logger.info(
+            f"[{label}] mean={timings_ms.mean():.3f}ms p50={np.percentile(timings_ms, 50):.3f}ms "
+            f"p99={np.percentile(timings_ms, 99):.3f}ms max={timings_ms.max():.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import asyncio
+
+from app.utils.key_pool import PRIORITY_INGESTION, PRIORITY_INTERACTIVE, KeyPool
+
+
+def test_ingestion_acquires_on_low_rate_key():
+    # At 30 requests/minute or less a key's bucket holds a single token, so the
+    # interactive reserve must not push ingestion's requirement above it
+    pool = KeyPool(["k"], 28)
+    key = asyncio.run(asyncio.wait_for(pool.acquire(PRIORITY_INGESTION), timeout=5))
+    assert key.api_key == "k"
+
+
+def test_ingestion_acquires_after_rate_cuts():
+    pool = KeyPool(["k"], 140)
+    key = pool.keys[0]
+    key.rate = 140 * 0.7 ** 5
+    key.tokens = key.capacity
+    assert asyncio.run(asyncio.wait_for(pool.acquire(PRIORITY_INGESTION), timeout=5)) is key
+
+
+def test_interactive_keeps_reserve_on_large_bucket():
+    pool = KeyPool(["k"], 600)
+    key = pool.keys[0]
+    key.tokens = key.ingestion_tokens - 0.5
+    key, wait = pool._take(PRIORITY_INGESTION, key._refilled_at)
+    assert key is None and wait > 0
+    assert pool._take(PRIORITY_INTERACTIVE, pool.keys[0]._refilled_at)[0] is pool.keys[0]